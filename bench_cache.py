@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Cache microbenchmark: throughput of get/set/evict at several cache sizes.
+
+    python bench_cache.py [sizes...]    (default: 1000 100000 1000000)
+"""
+import sys
+import time
+import asyncio
+
+from config import config
+from utils import Cache
+
+OPS = 200000
+
+async def bench(size: int):
+    config.REFRESH_AHEAD_ENABLED = False
+    cache = Cache()
+    value = {'status': 'success', 'title': 'x'}
+    
+    # Byte budget that holds exactly size entries (keys below are all the same length)
+    cache.max_bytes = 10 ** 12
+    await cache.set("key:0000000", value)
+    cache.max_bytes = cache.used_bytes * size
+    await cache.clear()
+    
+    # Fill to capacity
+    start = time.perf_counter()
+    for i in range(size):
+        await cache.set(f"key:{i:07d}", value)
+    fill = time.perf_counter() - start
+    
+    ops = min(OPS, size)
+    
+    # Hits
+    start = time.perf_counter()
+    for i in range(ops):
+        await cache.get(f"key:{i:07d}")
+    hits = time.perf_counter() - start
+    
+    # Misses
+    start = time.perf_counter()
+    for i in range(ops):
+        await cache.get(f"missing:{i:07d}")
+    misses = time.perf_counter() - start
+    
+    # Inserts into a full cache (each one evicts)
+    start = time.perf_counter()
+    for i in range(ops):
+        await cache.set(f"new:{i:07d}", value)
+    evicting = time.perf_counter() - start
+    
+    assert len(cache) == size
+    
+    print(f"{size:>9,} entries | "
+          f"fill {size / fill:>11,.0f} ops/s | "
+          f"get hit {ops / hits:>11,.0f} ops/s | "
+          f"get miss {ops / misses:>11,.0f} ops/s | "
+          f"set+evict {ops / evicting:>11,.0f} ops/s")
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 100000, 1000000]
+    for size in sizes:
+        asyncio.run(bench(size))
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
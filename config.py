@@ -10,18 +10,114 @@ class Config:
     # Rate limiting
     RATE_LIMIT_WINDOW: int = 5  # Increased from 2
     MAX_REQUESTS_PER_MINUTE: int = 15  # Reduced from 30
+    RATE_LIMIT_EXEMPT_PATHS: tuple = ("/thumbnail/", "/metrics", "/health")  # Path prefixes; cheap or polled endpoints
     
     # YouTube settings
-    YTDLP_TIMEOUT: int = 60
+    YTDLP_TIMEOUT: int = 60  # Hard wall-clock deadline per extraction
     COOKIES_FILE: Optional[str] = "cookies.txt" if os.path.exists("cookies.txt") else None
+    COOKIES_CHECK_INTERVAL: int = 5  # Seconds between mtime checks for hot reload
+
+    # Extraction executor (yt-dlp runs off the event loop)
+    EXTRACTION_WORKERS: int = 8
+    EXTRACTION_CONCURRENCY: dict = {  # Max concurrent extractions per endpoint
+        'stream': 6,
+        'audio': 6,
+        'info': 4,
+        'formats': 2,
+        'search': 4,
+        'playlist': 2,
+    }
+    
+    # Extraction backend: "thread" (default) or "process" for warm yt-dlp worker processes
+    EXTRACTION_BACKEND: str = "thread"
+    PROCESS_WORKERS: int = os.cpu_count() or 2
+    PROCESS_MAX_TASKS_PER_CHILD: int = 200  # Recycle workers to bound memory growth
+    PROCESS_JOB_TIMEOUT: int = 90  # Kill workers past this; must exceed YTDLP_TIMEOUT
+    
+    # Hedged audio extraction: start the next fallback method if the current
+    # one has not finished after AUDIO_HEDGE_DELAY seconds; first success wins
+    AUDIO_HEDGE_ENABLED: bool = True
+    AUDIO_HEDGE_DELAY: float = 3.0
+    AUDIO_HEDGE_MAX_PARALLEL: int = 2
     
+    # Adaptive ordering of audio methods by rolling success rate
+    AUDIO_METHOD_WINDOW: int = 50  # Recent attempts remembered per method
+    AUDIO_METHOD_EXPLORE_RATE: float = 0.05  # Share of requests that try a lower-ranked method first
+
     # Cache settings
     CACHE_TTL: int = 7200  # 2 hours
-    MAX_CACHE_SIZE: int = 1000
+    MAX_CACHE_BYTES: int = 256 * 1024 * 1024  # Approximate resident size budget
+    STREAM_EXPIRY_MARGIN: int = 600  # Treat googlevideo URLs as expired this many seconds early
+    CACHE_SWEEP_INTERVAL: int = 60  # Seconds between background sweeps of expired entries
+    CACHE_SWEEP_BATCH: int = 1000  # Entries checked per event-loop turn while sweeping
+    
+    # Search results live in their own cache so they never evict stream URLs
+    SEARCH_CACHE_TTL: int = 1800
+    SEARCH_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+    SEARCH_MIN_FETCH: int = 20  # One results page; smaller limits are sliced from it
+    
+    NEGATIVE_CACHE_TTL: dict = {  # Seconds to remember videos that can't be served
+        'unavailable': 3600,  # Deleted / removed (404)
+        'private': 1800,  # Private (403)
+        'geo_blocked': 900,  # Region-locked (451)
+    }
+    
+    # Second cache tier behind the in-memory cache: "sqlite" (on disk, survives
+    # restarts), "redis" (shared by all workers/replicas), "memory" (in-process
+    # stand-in for redis) or "none"
+    CACHE_BACKEND: str = "sqlite"
+    CACHE_DIR: str = "cache"
+    CACHE_L2_FLUSH_INTERVAL: float = 1.0  # Seconds between batched L2 writes
+    CACHE_NEAR_TTL: int = 30  # Seconds a shared entry is served from local memory before re-reading
+    CACHE_LEGACY_KEYS: bool = True  # Also look up pre-canonical stream keys (remove next release)
+    REDIS_URL: str = "redis://localhost:6379/0"
+    REDIS_PREFIX: str = "ytapi:"
+    REDIS_POOL_SIZE: int = 20
+    REDIS_TIMEOUT: float = 2.0
+    
+    # Thumbnail proxy (/thumbnail): originals and resized variants on disk
+    THUMBNAIL_DIR: str = os.path.join("cache", "thumbnails")
+    THUMBNAIL_CACHE_MAX_BYTES: int = 512 * 1024 * 1024
+    THUMBNAIL_WIDTHS: tuple = (120, 320, 480)  # Resized variants clients may request
+    THUMBNAIL_MAX_AGE: int = 7 * 24 * 3600  # Client Cache-Control lifetime
+    THUMBNAIL_FETCH_TIMEOUT: int = 10
+    THUMBNAIL_FETCH_CONCURRENCY: int = 16  # Open connections to i.ytimg.com
+    THUMBNAIL_EVICT_GRACE: int = 60  # Seconds after serving a file before it may be evicted
+    
+    # Refresh-ahead: hot entries are re-extracted in the background shortly
+    # before they expire while readers keep getting the still-valid value
+    REFRESH_AHEAD_ENABLED: bool = True
+    REFRESH_AHEAD_WINDOW: int = 900  # Seconds before expiry
+    REFRESH_AHEAD_MIN_HITS: int = 3  # Hits since the entry was stored
+    REFRESH_AHEAD_MAX_SHARE: float = 0.25  # Max share of EXTRACTION_WORKERS used by refreshes
+    
+    # Circuit breakers per audio method and per player client
+    BREAKER_FAILURE_THRESHOLD: int = 5  # Consecutive failures before opening
+    BREAKER_COOLDOWN: int = 300  # Seconds open before a half-open probe
+    
+    # Batch resolution (/batch/resolve)
+    BATCH_MAX_URLS: int = 200
+    BATCH_CONCURRENCY: int = 8
+    
+    # Prefetch / cache warming (/prefetch)
+    PREFETCH_WORKERS: int = 2
+    PREFETCH_QUEUE_SIZE: int = 1000
+    
+    # Playlist / channel expansion (/playlist, /channel)
+    PLAYLIST_PAGE_SIZE: int = 50
+    PLAYLIST_MAX_PAGES: int = 10  # Max pages walked per request
     
     # Proxy settings
     PROXY: Optional[str] = None  # Example: "http://proxy:port"
     
+    # Identity pool: extractions rotate across (cookie file, proxy) pairs.
+    # Example: [{'name': 'a', 'cookies': 'cookies_a.txt', 'proxy': 'http://proxy-a:port'}]
+    # Empty means a single identity built from COOKIES_FILE and PROXY.
+    IDENTITIES: list = []
+    IDENTITY_ERROR_WINDOW: int = 20  # Recent outcomes used for an identity's error rate
+    IDENTITY_EJECT_THRESHOLD: int = 2  # Consecutive 429s/bot checks before ejecting
+    IDENTITY_EJECT_COOLDOWN: int = 900  # Seconds an ejected identity sits out
+    
     # Download settings
     DOWNLOAD_DIR: str = "downloads"
     MAX_DOWNLOAD_SIZE: int = 500 * 1024 * 1024
@@ -0,0 +1,682 @@
+import os
+import re
+import time
+import signal
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Any
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+VIDEO_QUALITIES = ["low", "medium", "high", "best"]
+VIDEO_HEIGHT_LIMITS = {"low": 360, "medium": 480, "high": 720, "best": 1080}
+AUDIO_METHODS = ["cookies_method", "mixed_format_method", "dash_method", "generic_method"]
+
+class CookieStore:
+    """Shared cookie jar for one cookies.txt, reloaded when the file changes"""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.jar = None
+        self.mtime: Optional[float] = None  # mtime of the file the jar was loaded from
+        self.seen_mtime: Optional[float] = None  # mtime from the latest stat()
+        self.checked_at = 0.0
+        self.version = 0
+        self.lock = threading.Lock()
+
+    def _current_mtime(self) -> Optional[float]:
+        """mtime of the cookie file, stat()ed at most every COOKIES_CHECK_INTERVAL"""
+        now = time.time()
+        if now - self.checked_at >= config.COOKIES_CHECK_INTERVAL:
+            self.checked_at = now
+            try:
+                self.seen_mtime = os.stat(self.path).st_mtime
+            except (OSError, TypeError):
+                self.seen_mtime = None
+        return self.seen_mtime
+
+    def available(self) -> bool:
+        """Whether a cookie file is configured and present"""
+        return bool(self.path) and self._current_mtime() is not None
+
+    def get(self):
+        """Shared cookie jar, reloaded if cookies.txt changed (None without cookies)"""
+        mtime = self._current_mtime()
+        if mtime is None:
+            return None
+        if mtime != self.mtime or self.jar is None:
+            with self.lock:
+                if mtime != self.mtime or self.jar is None:
+                    from yt_dlp.cookies import YoutubeDLCookieJar
+
+                    jar = YoutubeDLCookieJar(self.path)
+                    try:
+                        jar.load(ignore_discard=True, ignore_expires=True)
+                    except Exception as e:
+                        # Likely caught mid-write; keep the previous jar and retry next check
+                        logger.error(f"❌ Failed to load cookies from {self.path}: {e}")
+                        return self.jar
+                    self.jar = jar
+                    self.mtime = mtime
+                    self.version += 1
+                    logger.info(f"🍪 Loaded cookies from {self.path} ({len(jar)} cookies)")
+        return self.jar
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'file': self.path,
+            'loaded': self.jar is not None,
+            'cookies': len(self.jar) if self.jar is not None else 0,
+            'mtime': self.mtime,
+            'reloads': self.version,
+        }
+
+_cookie_stores: Dict[Optional[str], CookieStore] = {}
+
+def cookie_store_for(path: Optional[str]) -> CookieStore:
+    """The shared CookieStore for a cookie file (one per process)"""
+    if path not in _cookie_stores:
+        _cookie_stores[path] = CookieStore(path)
+    return _cookie_stores[path]
+
+cookie_store = cookie_store_for(config.COOKIES_FILE)
+
+# Signs that YouTube is throttling or bot-checking the identity we extract as
+THROTTLE_MARKERS = (
+    'http error 429',
+    'too many requests',
+    "confirm you're not a bot",  # Not "sign in to confirm", which also matches the age gate
+)
+
+class IdentityThrottled(Exception):
+    """Extraction was rejected with a 429 or a bot check"""
+
+def is_throttle_message(message: str) -> bool:
+    message = (message or '').lower().replace('\u2019', "'")
+    return any(marker in message for marker in THROTTLE_MARKERS)
+
+# Per-video failures that no retry, method or player client will fix, checked
+# in order (YouTube often prefixes the specific reason with "Video unavailable")
+UNAVAILABLE_MARKERS = (
+    ('private', ('private video', 'video is private')),
+    ('geo_blocked', ('available in your country', 'blocked it in your country', 'geo restrict')),
+    ('unavailable', ('video unavailable', 'this video has been removed', 'no longer available',
+                     'video does not exist', 'has been terminated')),
+)
+
+UNAVAILABLE_STATUS = {'unavailable': 404, 'private': 403, 'geo_blocked': 451}
+
+class VideoUnavailable(Exception):
+    """The video itself can't be served: deleted, private or geo-blocked"""
+
+    def __init__(self, kind: str, message: str):
+        super().__init__(kind, message)
+        self.kind = kind
+        self.message = message
+
+    @property
+    def status(self) -> int:
+        return UNAVAILABLE_STATUS.get(self.kind, 404)
+
+    def __str__(self) -> str:
+        return self.message
+
+def classify_unavailable(error: Any) -> Optional[str]:
+    """Unavailability kind for a yt-dlp error or error message, if it is one"""
+    try:
+        from yt_dlp.utils import GeoRestrictedError
+    except ImportError:
+        GeoRestrictedError = None
+
+    # DownloadError wraps the extractor's exception in exc_info
+    causes = [error, (getattr(error, 'exc_info', None) or (None, None))[1]]
+    if GeoRestrictedError and any(isinstance(cause, GeoRestrictedError) for cause in causes):
+        return 'geo_blocked'
+
+    message = str(error or '').lower().replace('\u2019', "'")
+    for kind, markers in UNAVAILABLE_MARKERS:
+        if any(marker in message for marker in markers):
+            return kind
+    return None
+
+class ErrorLog:
+    """yt-dlp logger that keeps the error lines ignoreerrors would swallow"""
+
+    def __init__(self):
+        self.errors: List[str] = []
+
+    def debug(self, msg):
+        pass
+
+    def info(self, msg):
+        pass
+
+    def warning(self, msg):
+        pass
+
+    def error(self, msg):
+        self.errors.append(msg)
+
+def configured_identities() -> List[Dict[str, Any]]:
+    """
+    (cookie file, proxy) identities from config.IDENTITIES; without any, the
+    single COOKIES_FILE/PROXY pair is the only identity.
+    """
+    identities = []
+    for index, entry in enumerate(config.IDENTITIES or [{'cookies': config.COOKIES_FILE, 'proxy': config.PROXY}]):
+        identities.append({
+            'name': entry.get('name') or (f"identity-{index}" if config.IDENTITIES else "default"),
+            'cookies': entry.get('cookies'),
+            'proxy': entry.get('proxy'),
+        })
+    return identities
+
+def identity_options(ydl_opts: Dict[str, Any], identity: Optional[Dict[str, Any]] = None,
+                     use_cookies: bool = True) -> Dict[str, Any]:
+    """Route yt-dlp options through an identity's cookie file and proxy"""
+    cookies = identity.get('cookies') if identity else config.COOKIES_FILE
+    proxy = identity.get('proxy') if identity else config.PROXY
+
+    ydl_opts.pop('cookiefile', None)
+    ydl_opts.pop('proxy', None)
+    if use_cookies and cookies and cookie_store_for(cookies).available():
+        ydl_opts['cookiefile'] = cookies
+    if proxy:
+        ydl_opts['proxy'] = proxy
+    return ydl_opts
+
+_youtube_dl_class = None
+
+def _youtube_dl_class_with_jar():
+    """YoutubeDL subclass that can be handed its cookie jar up front"""
+    global _youtube_dl_class
+    if _youtube_dl_class is None:
+        import yt_dlp
+
+        class SharedJarYoutubeDL(yt_dlp.YoutubeDL):
+            def __init__(self, params=None, cookiejar=None, **kwargs):
+                if cookiejar is not None:
+                    # cookiejar is a cached_property; filling it before __init__
+                    # builds the request handlers is what makes them send it
+                    self.__dict__['cookiejar'] = cookiejar
+                super().__init__(params, **kwargs)
+
+        _youtube_dl_class = SharedJarYoutubeDL
+    return _youtube_dl_class
+
+def deadline_options(ydl_opts: Dict[str, Any]):
+    """
+    Clamp yt-dlp's network timeout, retries and request sleeps so a full
+    run of them fits inside YTDLP_TIMEOUT (threads can't be interrupted, so
+    an abandoned job otherwise holds its thread far past the deadline)
+    """
+    budget = config.YTDLP_TIMEOUT
+    socket_timeout = max(1, min(ydl_opts.get('socket_timeout') or budget, budget // 4))
+    attempts = max(1, budget // socket_timeout)
+    ydl_opts['socket_timeout'] = socket_timeout
+    ydl_opts['retries'] = min(ydl_opts.get('retries', 10), attempts - 1)
+    ydl_opts['extractor_retries'] = min(ydl_opts.get('extractor_retries', 3), attempts - 1)
+    ydl_opts['sleep_interval_requests'] = min(ydl_opts.get('sleep_interval_requests') or 0, budget / 20)
+
+def create_ydl(ydl_opts: Dict[str, Any]):
+    """
+    YoutubeDL that uses the shared cookie jar instead of re-reading
+    'cookiefile' from disk. 'cookiefile' in the options only marks that
+    cookies are wanted; the file is never passed on (so yt-dlp won't write
+    it back on close either).
+    """
+    ydl_opts = dict(ydl_opts)
+    cookies = ydl_opts.pop('cookiefile', None)
+    ydl_opts.setdefault('logger', ErrorLog())
+    deadline_options(ydl_opts)
+    jar = cookie_store_for(cookies).get() if cookies else None
+    return _youtube_dl_class_with_jar()(ydl_opts, cookiejar=jar)
+
+def extract_info(ydl, url: str) -> Optional[Dict[str, Any]]:
+    """
+    ydl.extract_info, raising IdentityThrottled when a 429 or bot check was
+    behind the failure and VideoUnavailable for deleted, private or
+    geo-blocked videos (ignoreerrors would otherwise just return None)
+    """
+    log = ydl.params.get('logger')
+    if isinstance(log, ErrorLog):
+        log.errors.clear()
+    try:
+        info = ydl.extract_info(url, download=False)
+    except Exception as e:
+        if is_throttle_message(str(e)):
+            raise IdentityThrottled(str(e)) from e
+        kind = classify_unavailable(e)
+        if kind:
+            raise VideoUnavailable(kind, str(e)) from e
+        raise
+    if info is None and isinstance(log, ErrorLog):
+        for message in log.errors:
+            if is_throttle_message(message):
+                raise IdentityThrottled(message)
+        for message in log.errors:
+            kind = classify_unavailable(message)
+            if kind:
+                raise VideoUnavailable(kind, message)
+    return info
+
+def player_clients() -> List[str]:
+    """Configured YouTube player clients, in the order yt-dlp tries them"""
+    return list(config.YTDLP_DEFAULT_OPTS['extractor_args']['youtube']['player_client'])
+
+def build_ydl_options(video_type: str = "video", quality: str = "best",
+                      player_client: Optional[str] = None,
+                      identity: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Get yt-dlp options with enhanced audio extraction"""
+    ydl_opts = config.YTDLP_DEFAULT_OPTS.copy()
+
+    # Add cookies if available (CRITICAL FOR AUDIO) and proxy if configured
+    identity_options(ydl_opts, identity)
+
+    # Region bypass for India
+    ydl_opts['geo_bypass'] = True
+    ydl_opts['geo_bypass_country'] = 'IN'
+
+    # Format selection
+    if video_type == "audio":
+        # Enhanced audio format selection
+        ydl_opts['format'] = 'bestaudio[ext=m4a]/bestaudio[ext=webm]/bestaudio/best'
+        ydl_opts['postprocessors'] = []
+
+        # Try multiple YouTube extractor settings (copy so the shared defaults stay intact)
+        ydl_opts['extractor_args'] = {
+            **ydl_opts['extractor_args'],
+            'youtube': {
+                'player_client': ['android', 'ios', 'web', 'tvhtml5'],
+                'player_skip': ['configs', 'webpage'],
+                'skip': ['hls', 'dash'],
+            }
+        }
+
+        # Don't require audio-only format, accept video+audio
+        ydl_opts['format'] = 'best[acodec!=none]'
+
+    elif video_type == "video":
+        if quality == "low":
+            ydl_opts['format'] = 'best[height<=360]'
+        elif quality == "medium":
+            ydl_opts['format'] = 'best[height<=480]'
+        elif quality == "high":
+            ydl_opts['format'] = 'best[height<=720]'
+        else:  # best
+            ydl_opts['format'] = 'best[height<=1080]/best'
+
+    # Pin a single player client so its circuit breaker sees its own outcome
+    if player_client:
+        ydl_opts['extractor_args'] = {
+            **ydl_opts['extractor_args'],
+            'youtube': {
+                **ydl_opts['extractor_args'].get('youtube', {}),
+                'player_client': [player_client],
+            }
+        }
+
+    return ydl_opts
+
+def build_audio_options(method_name: str, use_cookies: bool = False,
+                        identity: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Get yt-dlp options for one audio extraction method"""
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'extract_flat': False,
+        'socket_timeout': 30,
+        'ignoreerrors': True,
+    }
+
+    # Add cookies if requested and available, and proxy if configured
+    identity_options(ydl_opts, identity, use_cookies=use_cookies)
+
+    # Format selection based on method
+    if method_name == "cookies_method":
+        ydl_opts['format'] = 'bestaudio/best'
+    elif method_name == "mixed_format_method":
+        # Accept video+audio formats and extract audio
+        ydl_opts['format'] = 'best[acodec!=none]'
+        ydl_opts['postprocessors'] = [{
+            'key': 'FFmpegExtractAudio',
+            'preferredcodec': 'mp3',
+            'preferredquality': '192',
+        }]
+    elif method_name == "dash_method":
+        # Try DASH audio specifically
+        ydl_opts['format'] = 'bestaudio[protocol=dash]/bestaudio'
+    elif method_name == "generic_method":
+        ydl_opts['force_generic_extractor'] = True
+        ydl_opts['format'] = 'best'
+
+    return ydl_opts
+
+def build_audio_result(info: Optional[Dict[str, Any]], video_id: str, method_name: str) -> Dict[str, Any]:
+    """Pick the best audio format from extracted info and build the compact result"""
+    if not info:
+        return {'status': 'error', 'message': 'No video info found'}
+
+    formats = info.get('formats', [])
+
+    # Find suitable format
+    suitable_formats = []
+    for fmt in formats:
+        # For mixed format method, accept any format with audio
+        if method_name == "mixed_format_method" and fmt.get('acodec') != 'none':
+            suitable_formats.append(fmt)
+        # For other methods, look for audio-only or best audio
+        elif fmt.get('acodec') != 'none' and (fmt.get('vcodec') == 'none' or method_name != "mixed_format_method"):
+            suitable_formats.append(fmt)
+
+    if not suitable_formats:
+        return {'status': 'error', 'message': f'No suitable formats in {method_name}'}
+
+    # Sort by bitrate/quality
+    suitable_formats.sort(
+        key=lambda x: (
+            x.get('abr', 0) or x.get('tbr', 0) or 0,
+            x.get('asr', 0) or 0,
+            x.get('filesize', 0) or 0
+        ),
+        reverse=True
+    )
+
+    best_format = suitable_formats[0]
+
+    return {
+        'status': 'success',
+        'video_id': video_id,
+        'title': info.get('title', 'Unknown Title'),
+        'duration': info.get('duration', 0),
+        'stream_url': best_format['url'],
+        'type': 'audio',
+        'format': {
+            'ext': best_format.get('ext', 'm4a'),
+            'abr': best_format.get('abr', 128),
+            'asr': best_format.get('asr', 44100),
+            'vcodec': best_format.get('vcodec', 'none'),
+            'acodec': best_format.get('acodec', 'none'),
+            'filesize': best_format.get('filesize'),
+            'protocol': best_format.get('protocol', ''),
+            'format_note': best_format.get('format_note', '')
+        },
+        'method_used': method_name
+    }
+
+def build_video_result(info: Optional[Dict[str, Any]], video_id: str, quality: str = "best") -> Dict[str, Any]:
+    """Pick the best video format for quality from extracted info and build the compact result"""
+    if not info:
+        raise ValueError("Could not extract video info")
+
+    result = {
+        'status': 'success',
+        'video_id': video_id,
+        'title': info.get('title', 'Unknown Title'),
+        'duration': info.get('duration', 0),
+        'thumbnail': info.get('thumbnail', ''),
+        'channel': info.get('channel', 'Unknown Channel'),
+        'view_count': info.get('view_count', 0),
+        'like_count': info.get('like_count', 0),
+        'upload_date': info.get('upload_date', ''),
+    }
+
+    # Find best video format within the quality's height limit, preferring
+    # formats that carry audio too (same intent as 'best[height<=N]')
+    video_formats = [f for f in info.get('formats', [])
+                   if f.get('vcodec') != 'none']
+    limit = VIDEO_HEIGHT_LIMITS.get(quality, VIDEO_HEIGHT_LIMITS["best"])
+    within_limit = [f for f in video_formats if (f.get('height') or 0) <= limit]
+    with_audio = [f for f in within_limit if f.get('acodec') != 'none']
+    video_formats = with_audio or within_limit or video_formats
+
+    if not video_formats:
+        raise ValueError("No suitable video format found")
+
+    video_formats.sort(
+        key=lambda x: (
+            x.get('height', 0) or 0,
+            x.get('width', 0) or 0,
+            x.get('fps', 0) or 0
+        ),
+        reverse=True
+    )
+    best_video = video_formats[0]
+    result.update({
+        'stream_url': best_video['url'],
+        'type': 'video',
+        'format': {
+            'ext': best_video.get('ext', 'mp4'),
+            'height': best_video.get('height'),
+            'width': best_video.get('width'),
+            'fps': best_video.get('fps'),
+            'filesize': best_video.get('filesize'),
+            'format_note': best_video.get('format_note', '')
+        }
+    })
+
+    return result
+
+# Fields kept per format in the compact video record
+RECORD_FORMAT_FIELDS = (
+    'format_id', 'url', 'ext', 'resolution', 'height', 'width', 'fps',
+    'vcodec', 'acodec', 'abr', 'asr', 'tbr', 'filesize', 'filesize_approx',
+    'protocol', 'format_note',
+)
+
+def stream_url_expiry(url: str) -> Optional[float]:
+    """Read the expire= timestamp googlevideo embeds in stream URLs"""
+    match = re.search(r'[?&/]expire[=/](\d+)', url or '')
+    return float(match.group(1)) if match else None
+
+def build_video_record(info: Optional[Dict[str, Any]], video_id: str,
+                       method_name: str = "default") -> Optional[Dict[str, Any]]:
+    """
+    Compact per-video record: metadata plus the full format table.
+    Every endpoint derives its response from this instead of re-extracting.
+    """
+    if not info:
+        return None
+
+    formats = []
+    for fmt in info.get('formats') or []:
+        if not fmt.get('url'):
+            continue
+        formats.append({
+            key: fmt[key] for key in RECORD_FORMAT_FIELDS
+            if fmt.get(key) is not None
+        })
+
+    extracted_at = time.time()
+    expiries = [e for e in (stream_url_expiry(f['url']) for f in formats) if e]
+
+    return {
+        'video_id': video_id,
+        'title': info.get('title'),
+        'description': info.get('description', '')[:500] + '...' if info.get('description') else '',
+        'duration': info.get('duration'),
+        'thumbnail': info.get('thumbnail'),
+        'channel': info.get('channel'),
+        'channel_id': info.get('channel_id'),
+        'view_count': info.get('view_count'),
+        'like_count': info.get('like_count'),
+        'upload_date': info.get('upload_date'),
+        'categories': info.get('categories', []),
+        'tags': info.get('tags', [])[:10],
+        'age_limit': info.get('age_limit', 0),
+        'is_live': info.get('is_live', False),
+        'webpage_url': info.get('webpage_url'),
+        'formats': formats,
+        'extraction_method': method_name,
+        'extracted_at': extracted_at,
+        'expires_at': min(expiries) if expiries else extracted_at + config.CACHE_TTL,
+    }
+
+def extract_record(ydl_opts: Dict[str, Any], url: str, video_id: str,
+                   method_name: str = "default") -> Optional[Dict[str, Any]]:
+    """Blocking extraction straight to a compact record (runs in the extraction executor)"""
+    with create_ydl(ydl_opts) as ydl:
+        info = extract_info(ydl, url)
+    return build_video_record(info, video_id, method_name)
+
+def extract_flat_page(ydl_opts: Dict[str, Any], url: str, start: int, size: int) -> Dict[str, Any]:
+    """
+    Blocking flat extraction of one page (entries start..start+size-1) of a
+    playlist or channel. Only the continuation pages needed are fetched.
+    """
+    ydl_opts = {
+        **ydl_opts,
+        'extract_flat': 'in_playlist',
+        'lazy_playlist': True,
+        'playlist_items': f"{start}-{start + size - 1}",
+    }
+
+    with create_ydl(ydl_opts) as ydl:
+        info = extract_info(ydl, url) or {}
+
+    entries = []
+    for entry in info.get('entries') or []:
+        if entry and entry.get('id'):
+            entries.append({
+                'video_id': entry.get('id'),
+                'title': entry.get('title', 'No Title'),
+                'duration': entry.get('duration'),
+                'thumbnail': (entry.get('thumbnails') or [{}])[-1].get('url'),
+                'channel': entry.get('channel') or entry.get('uploader'),
+                'view_count': entry.get('view_count'),
+                'url': f"https://youtube.com/watch?v={entry.get('id')}",
+            })
+
+    return {
+        'id': info.get('id'),
+        'title': info.get('title'),
+        'channel': info.get('channel') or info.get('uploader'),
+        'entries': entries,
+        'has_more': len(entries) >= size,
+    }
+
+# Process-pool worker side. Each worker process keeps one warm YoutubeDL
+# instance per option set, built once by init_worker().
+
+@contextmanager
+def extraction_deadline(seconds: float):
+    """
+    Raise TimeoutError inside a worker process once seconds have passed.
+    Jobs run on the worker's main thread, so SIGALRM interrupts even a
+    blocking socket read or retry sleep inside yt-dlp. With ignoreerrors
+    yt-dlp swallows the alarm's exception and returns None (or fails with
+    a generic error), so once the alarm has fired the block always ends
+    in TimeoutError.
+    """
+    message = f"Extraction timed out after {seconds}s"
+    fired = False
+
+    def on_alarm(signum, frame):
+        nonlocal fired
+        fired = True
+        raise TimeoutError(message)
+
+    previous = signal.signal(signal.SIGALRM, on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    except Exception as e:
+        if fired and not isinstance(e, TimeoutError):
+            raise TimeoutError(message) from e
+        raise
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+    if fired:
+        raise TimeoutError(message)
+
+_worker_options: Dict[str, Dict[str, Any]] = {}
+_worker_ydls: Dict[str, Any] = {}  # key -> (YoutubeDL, cookie jar version it was built with)
+
+def _warm_identity(identity: Optional[Dict[str, Any]]):
+    """Build every option set for one identity (keys are prefixed with its name)"""
+    prefix = identity['name'] if identity else "default"
+    option_sets = {}
+    for quality in VIDEO_QUALITIES:
+        option_sets[f"{prefix}:video:{quality}"] = build_ydl_options("video", quality, identity=identity)
+    for client in player_clients():
+        option_sets[f"{prefix}:video:best:{client}"] = build_ydl_options(
+            "video", "best", player_client=client, identity=identity
+        )
+    for method_name in AUDIO_METHODS:
+        option_sets[f"{prefix}:audio:{method_name}"] = build_audio_options(
+            method_name, use_cookies=(method_name == "cookies_method"), identity=identity
+        )
+
+    for key, ydl_opts in option_sets.items():
+        store = cookie_store_for(ydl_opts.get('cookiefile'))
+        _worker_options[key] = ydl_opts
+        _worker_ydls[key] = (create_ydl(ydl_opts), store.version)
+
+def _warm_ydl(key: str, identity: Optional[Dict[str, Any]]):
+    """Warm YoutubeDL for an option set, rebuilt only if its cookies.txt was reloaded"""
+    key = f"{identity['name'] if identity else 'default'}:{key}"
+    if key not in _worker_ydls:
+        _warm_identity(identity)
+    ydl, cookie_version = _worker_ydls[key]
+    cookies = _worker_options[key].get('cookiefile')
+    if cookies:
+        store = cookie_store_for(cookies)
+        store.get()
+        if cookie_version != store.version:
+            ydl.close()
+            ydl = create_ydl(_worker_options[key])
+            _worker_ydls[key] = (ydl, store.version)
+    return ydl
+
+def init_worker():
+    """Process-pool initializer: import yt_dlp and build every option set once per identity"""
+    for identity in configured_identities():
+        _warm_identity(identity)
+
+    logger.info(f"⚙️ Extraction worker {os.getpid()} ready ({len(_worker_ydls)} option sets)")
+
+def worker_loop(conn, initializer):
+    """Extraction worker process: run (func, args) jobs sent over conn until it closes"""
+    initializer()
+    while True:
+        try:
+            func, args = conn.recv()
+        except EOFError:
+            return
+        try:
+            reply = (True, func(*args))
+        except Exception as e:
+            reply = (False, e)
+        try:
+            conn.send(reply)
+        except Exception as e:
+            # Unpicklable result or exception; pickling fails before anything is sent
+            conn.send((False, RuntimeError(f"{type(e).__name__}: {e}")))
+
+def resolve_record(url: str, mode: str, quality: str, video_id: str,
+                   method_name: Optional[str] = None,
+                   player_client: Optional[str] = None,
+                   identity: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Resolve one (url, mode, quality) job inside a worker process into the
+    compact video record. Audio jobs name the extraction method to run;
+    video jobs may pin a single player client. The job runs as the given
+    identity (cookie file + proxy).
+    """
+    if mode == "audio":
+        method_name = method_name or "mixed_format_method"
+        ydl = _warm_ydl(f"audio:{method_name}", identity)
+    elif player_client:
+        method_name = "default"
+        ydl = _warm_ydl(f"video:best:{player_client}", identity)
+    else:
+        method_name = "default"
+        ydl = _warm_ydl(f"video:{quality if quality in VIDEO_QUALITIES else 'best'}", identity)
+
+    with extraction_deadline(config.YTDLP_TIMEOUT):
+        info = extract_info(ydl, url)
+    return build_video_record(info, video_id, method_name)
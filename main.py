@@ -1,12 +1,13 @@
 import asyncio
 import time
 import json
+import re
+import hashlib
 import os
 import logging
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Tuple, Any
 from contextlib import asynccontextmanager
 
-import yt_dlp
 import uvicorn
 from fastapi import FastAPI, HTTPException, Query, Request, BackgroundTasks, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
@@ -17,9 +18,43 @@ from fastapi.responses import (
     FileResponse
 )
 from fastapi.staticfiles import StaticFiles
+from pydantic import BaseModel
 
 from config import config
-from utils import youtube_utils, rate_limiter, cache
+from utils import (
+    youtube_utils,
+    rate_limiter,
+    cache,
+    extraction_executor,
+    method_ranker,
+    single_flight,
+    prefetch_queue,
+    circuit_breakers,
+    search_cache,
+    render_metrics,
+    identity_pool,
+    thumbnail_cache,
+    ExtractionTimeout,
+    ThumbnailNotFound,
+)
+from extraction import (
+    AUDIO_METHODS,
+    UNAVAILABLE_STATUS,
+    IdentityThrottled,
+    VIDEO_QUALITIES,
+    VideoUnavailable,
+    build_ydl_options,
+    build_audio_options,
+    build_audio_result,
+    build_video_result,
+    create_ydl,
+    extract_flat_page,
+    extract_record,
+    identity_options,
+    init_worker,
+    player_clients,
+    resolve_record,
+)
 
 # Setup logging
 logging.basicConfig(
@@ -45,13 +80,39 @@ async def lifespan(app: FastAPI):
     logger.info(f"📁 Download directory: {config.DOWNLOAD_DIR}")
     logger.info(f"🌐 Server will run on: http://{config.HOST}:{config.PORT}")
     
-    if config.COOKIES_FILE and os.path.exists(config.COOKIES_FILE):
+    if identity_pool.has_cookies():
         logger.info("🍪 Cookies file detected")
     
+    if config.IDENTITIES:
+        logger.info(f"🪪 Rotating across {len(identity_pool.identities)} identities")
+    elif config.PROXY:
+        logger.info(f"🌐 Using proxy: {config.PROXY}")
+    
+    if config.EXTRACTION_BACKEND == "process":
+        extraction_executor.start_processes(init_worker)
+        logger.info(f"⚙️ Process extraction backend: {config.PROCESS_WORKERS} workers")
+    
+    warmed = await cache.open_l2()
+    if warmed:
+        logger.info(f"💾 Warmed cache with {warmed} entries from disk")
+    await search_cache.open_l2()
+    
+    await thumbnail_cache.start()
+    prefetch_queue.start(prefetch_video)
+    cache.start_sweeper()
+    search_cache.start_sweeper()
+    
     yield
     
     # Shutdown
     logger.info("👋 Shutting down YouTube Streaming API Server...")
+    prefetch_queue.stop()
+    cache.stop_sweeper()
+    search_cache.stop_sweeper()
+    await cache.close_l2()
+    await search_cache.close_l2()
+    await thumbnail_cache.close()
+    extraction_executor.shutdown()
 
 # Create FastAPI app
 app = FastAPI(
@@ -81,8 +142,9 @@ async def rate_limit_middleware(request: Request, call_next):
     """Rate limiting middleware"""
     client_ip = request.client.host if request.client else "unknown"
     
-    # Check rate limit
-    if not await rate_limiter.check_limit(client_ip):
+    # Check rate limit (a page loads many thumbnails at once)
+    exempt = request.url.path.startswith(config.RATE_LIMIT_EXEMPT_PATHS)
+    if not exempt and not await rate_limiter.check_limit(client_ip):
         return JSONResponse(
             status_code=429,
             content={
@@ -104,199 +166,301 @@ async def rate_limit_middleware(request: Request, call_next):
     
     return response
 
+def run_extraction(ydl_opts: Dict[str, Any], url: str) -> Optional[Dict[str, Any]]:
+    """Blocking yt-dlp extraction (always called through extraction_executor)"""
+    with create_ydl(ydl_opts) as ydl:
+        return ydl.extract_info(url, download=False)
+
 # Enhanced YouTubeDownloader class
 class YouTubeDownloader:
     @staticmethod
     def get_ydl_options(video_type: str = "video", quality: str = "best"):
         """Get yt-dlp options with enhanced audio extraction"""
-        ydl_opts = config.YTDLP_DEFAULT_OPTS.copy()
-        
-        # Add cookies if available (CRITICAL FOR AUDIO)
-        if config.COOKIES_FILE and os.path.exists(config.COOKIES_FILE):
-            ydl_opts['cookiefile'] = config.COOKIES_FILE
-            logger.info(f"🍪 Using cookies from {config.COOKIES_FILE}")
-        
-        # Add proxy if configured
-        if config.PROXY:
-            ydl_opts['proxy'] = config.PROXY
-            logger.info(f"🌐 Using proxy: {config.PROXY}")
-        
-        # Region bypass for India
-        ydl_opts['geo_bypass'] = True
-        ydl_opts['geo_bypass_country'] = 'IN'
-        
-        # Format selection
-        if video_type == "audio":
-            # Enhanced audio format selection
-            ydl_opts['format'] = 'bestaudio[ext=m4a]/bestaudio[ext=webm]/bestaudio/best'
-            ydl_opts['postprocessors'] = []
-            
-            # Try multiple YouTube extractor settings
-            ydl_opts['extractor_args'].update({
-                'youtube': {
-                    'player_client': ['android', 'ios', 'web', 'tvhtml5'],
-                    'player_skip': ['configs', 'webpage'],
-                    'skip': ['hls', 'dash'],
-                }
-            })
-            
-            # Don't require audio-only format, accept video+audio
-            ydl_opts['format'] = 'best[acodec!=none]'
-            
-        elif video_type == "video":
-            if quality == "low":
-                ydl_opts['format'] = 'best[height<=360]'
-            elif quality == "medium":
-                ydl_opts['format'] = 'best[height<=480]'
-            elif quality == "high":
-                ydl_opts['format'] = 'best[height<=720]'
-            else:  # best
-                ydl_opts['format'] = 'best[height<=1080]/best'
-        
-        return ydl_opts
+        return build_ydl_options(video_type, quality)
+    
+    # Hedged audio extraction counters (reported in /stats)
+    hedge_stats: Dict[str, Any] = {
+        'requests': 0,
+        'hedges_launched': 0,
+        'cancelled': 0,
+        'wins': {},
+        'time_saved_total': 0.0,
+    }
+    negative_stats = {
+        'stored': 0,
+        'served': 0,
+    }
+    
+    @staticmethod
+    async def get_unavailable(video_id: Optional[str]) -> Optional[VideoUnavailable]:
+        """Negatively cached failure for a deleted, private or geo-blocked video"""
+        if not video_id:
+            return None
+        entry = await cache.get(f"unavailable:{video_id}")
+        if not entry:
+            return None
+        YouTubeDownloader.negative_stats['served'] += 1
+        return VideoUnavailable(entry['kind'], entry['message'])
+    
+    @staticmethod
+    async def mark_unavailable(video_id: str, error: VideoUnavailable):
+        """Remember an unavailable video for its kind's NEGATIVE_CACHE_TTL"""
+        logger.info(f"🚫 {video_id} is {error.kind}: {error.message}")
+        if error.kind == 'geo_blocked' and len({i['proxy'] for i in identity_pool.identities}) > 1:
+            # Seen from one identity's proxy; identities exiting elsewhere may
+            # still get the video, so the block isn't cached for all of them
+            return
+        YouTubeDownloader.negative_stats['stored'] += 1
+        await cache.set(
+            f"unavailable:{video_id}",
+            {'kind': error.kind, 'message': error.message},
+            ttl=config.NEGATIVE_CACHE_TTL.get(error.kind, 300)
+        )
+    
+    @staticmethod
+    def unavailable_result(video_id: str, error: VideoUnavailable) -> Dict[str, Any]:
+        return {
+            'status': 'error',
+            'message': error.message,
+            'unavailable': error.kind,
+            'video_id': video_id,
+        }
+    
+    @staticmethod
+    def _audio_methods(use_cookies: bool = True) -> List[Tuple[str, Dict[str, Any]]]:
+        """Audio extraction methods in fallback order, with their options"""
+        methods = []
+        
+        # Method 1: Try with cookies (most likely to work)
+        if use_cookies and identity_pool.has_cookies():
+            methods.append(("cookies_method", {'use_cookies': True}))
+        
+        # Method 2: Try without audio-only restriction
+        methods.append(("mixed_format_method", {'accept_video': True}))
+        
+        # Method 3: Try DASH audio extraction
+        methods.append(("dash_method", {'extract_dash': True}))
+        
+        # Method 4: Last resort - try generic extractor
+        methods.append(("generic_method", {'force_generic': True}))
+        
+        return methods
     
     @staticmethod
     async def get_audio_stream(url: str, use_cookies: bool = True) -> Dict[str, Any]:
         """Specialized method for audio streaming with multiple fallbacks"""
+        video_id = youtube_utils.extract_video_id(url) or url
+        
+        unavailable = await YouTubeDownloader.get_unavailable(video_id)
+        if unavailable:
+            return YouTubeDownloader.unavailable_result(video_id, unavailable)
+        
+        # Concurrent requests for the same video share one extraction
+        return await single_flight.do(
+            f"audio:{video_id}:{'cookies' if use_cookies else 'nocookies'}",
+            lambda: YouTubeDownloader._get_audio_stream(url, use_cookies)
+        )
+    
+    @staticmethod
+    async def _get_audio_stream(url: str, use_cookies: bool = True) -> Dict[str, Any]:
         video_id = youtube_utils.extract_video_id(url)
-        logger.info(f"🎵 Attempting audio extraction for: {video_id}")
         
-        # Method 1: Try with cookies (most likely to work)
-        if use_cookies and config.COOKIES_FILE and os.path.exists(config.COOKIES_FILE):
-            result = await YouTubeDownloader._try_audio_method(
-                url, video_id, "cookies_method", use_cookies=True
-            )
+        # A fresh record from any earlier extraction already holds the audio formats
+        record = await YouTubeDownloader.get_cached_record(video_id)
+        if record:
+            result = build_audio_result(record, video_id, record['extraction_method'])
             if result['status'] == 'success':
                 return result
         
-        # Method 2: Try without audio-only restriction
-        result = await YouTubeDownloader._try_audio_method(
-            url, video_id, "mixed_format_method", accept_video=True
-        )
-        if result['status'] == 'success':
-            return result
+        logger.info(f"🎵 Attempting audio extraction for: {video_id}")
         
-        # Method 3: Try DASH audio extraction
-        result = await YouTubeDownloader._try_audio_method(
-            url, video_id, "dash_method", extract_dash=True
-        )
-        if result['status'] == 'success':
+        # Most-likely-to-succeed method first, based on recent outcomes
+        methods = dict(YouTubeDownloader._audio_methods(use_cookies))
+        methods = [(name, methods[name]) for name in method_ranker.rank(list(methods))]
+        
+        if config.AUDIO_HEDGE_ENABLED:
+            return await YouTubeDownloader._hedge_audio_methods(url, video_id, methods)
+        
+        for method_name, kwargs in methods:
+            result = await YouTubeDownloader._try_audio_method(url, video_id, method_name, **kwargs)
+            if result['status'] == 'success' or result.get('unavailable'):
+                return result
+        
+        return result
+    
+    @staticmethod
+    async def _hedge_audio_methods(url: str, video_id: str, methods: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        Race audio methods: the preferred method starts first, the next one
+        starts after AUDIO_HEDGE_DELAY (or as soon as a method fails), and the
+        first success wins. Losing attempts are cancelled; one already running
+        in a thread keeps its extraction slot until yt-dlp returns (see
+        ExtractionExecutor.run), so a saturated pool delays further hedges.
+        """
+        stats = YouTubeDownloader.hedge_stats
+        stats['requests'] += 1
+        
+        start_time = time.time()
+        pending: Dict[asyncio.Task, Tuple[int, float]] = {}
+        durations: Dict[int, float] = {}
+        next_index = 0
+        result = {'status': 'error', 'message': 'No audio methods available'}
+        winner = None
+        
+        def launch():
+            nonlocal next_index
+            method_name, kwargs = methods[next_index]
+            task = asyncio.create_task(
+                YouTubeDownloader._try_audio_method(url, video_id, method_name, **kwargs)
+            )
+            pending[task] = (next_index, time.time())
+            next_index += 1
+        
+        def can_launch() -> bool:
+            return next_index < len(methods) and len(pending) < config.AUDIO_HEDGE_MAX_PARALLEL
+        
+        try:
+            launch()
+            while pending and winner is None and not result.get('unavailable'):
+                done, _ = await asyncio.wait(
+                    pending,
+                    timeout=config.AUDIO_HEDGE_DELAY if can_launch() else None,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                
+                if not done:
+                    # Hedge: the running method is slow, start the next one alongside it
+                    stats['hedges_launched'] += 1
+                    launch()
+                    continue
+                
+                for task in sorted(done, key=lambda t: pending[t][0]):
+                    index, started = pending.pop(task)
+                    durations[index] = time.time() - started
+                    task_result = task.result()
+                    if winner is None and task_result['status'] == 'success':
+                        winner = index
+                        result = task_result
+                    elif winner is None:
+                        result = task_result
+                
+                # A failed method frees its slot for the next fallback right away;
+                # an unavailable video ends the race, no other method will help
+                while winner is None and not result.get('unavailable') and can_launch():
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+            stats['cancelled'] += len(pending)
+        
+        if winner is None:
             return result
         
-        # Method 4: Last resort - try generic extractor
-        result = await YouTubeDownloader._try_audio_method(
-            url, video_id, "generic_method", force_generic=True
-        )
+        # Estimate what the sequential chain would have cost: every method
+        # ordered before the winner runs (at least as long as it ran here),
+        # then the winner itself
+        now = time.time()
+        sequential = durations[winner]
+        for index, started in pending.values():
+            if index < winner:
+                sequential += now - started
+        sequential += sum(d for i, d in durations.items() if i < winner)
+        time_saved = max(0.0, sequential - (now - start_time))
         
+        method_name = methods[winner][0]
+        stats['wins'][method_name] = stats['wins'].get(method_name, 0) + 1
+        stats['time_saved_total'] += time_saved
+        
+        result = dict(result)
+        result['time_saved'] = round(time_saved, 3)
         return result
     
     @staticmethod
     async def _try_audio_method(url: str, video_id: str, method_name: str, **kwargs) -> Dict[str, Any]:
         """Try a specific audio extraction method"""
+        breaker = circuit_breakers.get(f"method:{method_name}")
+        if not breaker.allow():
+            # Broken path: skip it immediately instead of burning retries
+            return {'status': 'error', 'message': f'{method_name}: circuit open'}
+        
+        identity = identity_pool.acquire()
+        error = None
+        start_time = time.time()
         try:
-            logger.info(f"🔄 Trying {method_name} for {video_id}")
+            logger.info(f"🔄 Trying {method_name} for {video_id} as {identity['name']}")
             
-            ydl_opts = {
-                'quiet': True,
-                'no_warnings': True,
-                'extract_flat': False,
-                'socket_timeout': 30,
-                'ignoreerrors': True,
-            }
-            
-            # Add cookies if requested and available
-            if kwargs.get('use_cookies') and config.COOKIES_FILE and os.path.exists(config.COOKIES_FILE):
-                ydl_opts['cookiefile'] = config.COOKIES_FILE
-            
-            # Format selection based on method
-            if method_name == "cookies_method":
-                ydl_opts['format'] = 'bestaudio/best'
-            elif method_name == "mixed_format_method":
-                # Accept video+audio formats and extract audio
-                ydl_opts['format'] = 'best[acodec!=none]'
-                ydl_opts['postprocessors'] = [{
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': 'mp3',
-                    'preferredquality': '192',
-                }]
-            elif method_name == "dash_method":
-                # Try DASH audio specifically
-                ydl_opts['format'] = 'bestaudio[protocol=dash]/bestaudio'
-            elif method_name == "generic_method":
-                ydl_opts['force_generic_extractor'] = True
-                ydl_opts['format'] = 'best'
+            if config.EXTRACTION_BACKEND == "process":
+                record = await extraction_executor.run_process(
+                    "audio", resolve_record, url, "audio", "best", video_id, method_name, None, identity
+                )
+            else:
+                ydl_opts = build_audio_options(
+                    method_name, use_cookies=kwargs.get('use_cookies', False), identity=identity
+                )
+                record = await extraction_executor.run(
+                    "audio", extract_record, ydl_opts, url, video_id, method_name
+                )
             
-            # Add proxy if configured
-            if config.PROXY:
-                ydl_opts['proxy'] = config.PROXY
+            result = build_audio_result(record, video_id, method_name)
             
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                
-                if not info:
-                    return {'status': 'error', 'message': 'No video info found'}
-                
-                formats = info.get('formats', [])
-                
-                # Find suitable format
-                suitable_formats = []
-                for fmt in formats:
-                    # For mixed format method, accept any format with audio
-                    if method_name == "mixed_format_method" and fmt.get('acodec') != 'none':
-                        suitable_formats.append(fmt)
-                    # For other methods, look for audio-only or best audio
-                    elif fmt.get('acodec') != 'none' and (fmt.get('vcodec') == 'none' or method_name != "mixed_format_method"):
-                        suitable_formats.append(fmt)
-                
-                if not suitable_formats:
-                    return {'status': 'error', 'message': f'No suitable formats in {method_name}'}
-                
-                # Sort by bitrate/quality
-                suitable_formats.sort(
-                    key=lambda x: (
-                        x.get('abr', 0) or x.get('tbr', 0) or 0,
-                        x.get('asr', 0) or 0,
-                        x.get('filesize', 0) or 0
-                    ),
-                    reverse=True
-                )
-                
-                best_format = suitable_formats[0]
-                
-                return {
-                    'status': 'success',
-                    'video_id': video_id,
-                    'title': info.get('title', 'Unknown Title'),
-                    'duration': info.get('duration', 0),
-                    'stream_url': best_format['url'],
-                    'type': 'audio',
-                    'format': {
-                        'ext': best_format.get('ext', 'm4a'),
-                        'abr': best_format.get('abr', 128),
-                        'asr': best_format.get('asr', 44100),
-                        'vcodec': best_format.get('vcodec', 'none'),
-                        'acodec': best_format.get('acodec', 'none'),
-                        'filesize': best_format.get('filesize'),
-                        'protocol': best_format.get('protocol', ''),
-                        'format_note': best_format.get('format_note', '')
-                    },
-                    'method_used': method_name
-                }
+            # Share the extraction with /info, /formats and video streams. The
+            # generic extractor's view of the page is not a usable YouTube record.
+            if result['status'] == 'success' and method_name != "generic_method":
+                await cache.set(f"record:{video_id}", record)
                 
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except VideoUnavailable as e:
+            # The video's fault, not the method's: leave its breaker and ranking alone
+            breaker.release()
+            identity_pool.record(identity, True, time.time() - start_time)
+            await YouTubeDownloader.mark_unavailable(video_id, e)
+            return YouTubeDownloader.unavailable_result(video_id, e)
+        except IdentityThrottled as e:
+            # The identity's fault, not the method's: only the identity pays
+            logger.error(f"{method_name} throttled as {identity['name']}: {e}")
+            breaker.release()
+            identity_pool.record(identity, False, time.time() - start_time, e)
+            return {'status': 'error', 'message': f'{method_name}: {str(e)}'}
         except Exception as e:
             logger.error(f"{method_name} failed: {e}")
-            return {'status': 'error', 'message': f'{method_name}: {str(e)}'}
+            error = e
+            result = {
+                'status': 'error',
+                'message': f'{method_name}: {str(e)}',
+                'timed_out': isinstance(e, TimeoutError)
+            }
+        
+        # Cancelled (hedged-out) attempts never get here, so they don't count
+        if result['status'] == 'success':
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+        latency = time.time() - start_time
+        method_ranker.record(method_name, result['status'] == 'success', latency)
+        identity_pool.record(identity, result['status'] == 'success', latency, error)
+        return result
     
     @staticmethod
     async def get_stream_info(url: str, video_type: str = "video", quality: str = "best") -> Dict[str, Any]:
         """Get streaming information for YouTube URL"""
+        video_id = youtube_utils.extract_video_id(url) or url
+        
+        return await single_flight.do(
+            cache.stream_key(video_id, video_type, quality),
+            lambda: YouTubeDownloader._get_stream_info(url, video_type, quality)
+        )
+    
+    @staticmethod
+    async def _get_stream_info(url: str, video_type: str, quality: str) -> Dict[str, Any]:
         try:
             video_id = youtube_utils.extract_video_id(url)
             if not video_id:
                 raise ValueError("Invalid YouTube URL")
             
             # Check cache first
-            cache_key = f"{video_id}:{video_type}:{quality}"
+            cache_key = cache.stream_key(video_id, video_type, quality)
             cached_data = await cache.get(cache_key)
             if cached_data:
                 logger.info(f"🎯 Cache hit for {video_id}")
@@ -308,54 +472,8 @@ class YouTubeDownloader:
             if video_type == "audio":
                 result = await YouTubeDownloader.get_audio_stream(url)
             else:
-                ydl_opts = YouTubeDownloader.get_ydl_options(video_type, quality)
-                
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    info = ydl.extract_info(url, download=False)
-                    
-                    if not info:
-                        raise ValueError("Could not extract video info")
-                    
-                    result = {
-                        'status': 'success',
-                        'video_id': video_id,
-                        'title': info.get('title', 'Unknown Title'),
-                        'duration': info.get('duration', 0),
-                        'thumbnail': info.get('thumbnail', ''),
-                        'channel': info.get('channel', 'Unknown Channel'),
-                        'view_count': info.get('view_count', 0),
-                        'like_count': info.get('like_count', 0),
-                        'upload_date': info.get('upload_date', ''),
-                    }
-                    
-                    # Find best video format
-                    video_formats = [f for f in info.get('formats', []) 
-                                   if f.get('vcodec') != 'none']
-                    
-                    if video_formats:
-                        video_formats.sort(
-                            key=lambda x: (
-                                x.get('height', 0) or 0,
-                                x.get('width', 0) or 0,
-                                x.get('fps', 0) or 0
-                            ),
-                            reverse=True
-                        )
-                        best_video = video_formats[0]
-                        result.update({
-                            'stream_url': best_video['url'],
-                            'type': 'video',
-                            'format': {
-                                'ext': best_video.get('ext', 'mp4'),
-                                'height': best_video.get('height'),
-                                'width': best_video.get('width'),
-                                'fps': best_video.get('fps'),
-                                'filesize': best_video.get('filesize'),
-                                'format_note': best_video.get('format_note', '')
-                            }
-                        })
-                    else:
-                        raise ValueError("No suitable video format found")
+                record = await YouTubeDownloader.get_video_record(url)
+                result = build_video_result(record, video_id, quality)
             
             # Cache successful results
             if result['status'] == 'success':
@@ -368,12 +486,141 @@ class YouTubeDownloader:
             return {
                 'status': 'error',
                 'message': str(e),
+                'timed_out': isinstance(e, TimeoutError),
+                'unavailable': e.kind if isinstance(e, VideoUnavailable) else None,
                 'video_id': youtube_utils.extract_video_id(url) or 'unknown'
             }
 
+    @staticmethod
+    async def get_cached_record(video_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Cached video record, unless its stream URLs are about to expire"""
+        if not video_id:
+            return None
+        # The cache drops records STREAM_EXPIRY_MARGIN before their URLs expire
+        return await cache.get(f"record:{video_id}")
+    
+    @staticmethod
+    async def get_video_record(url: str, endpoint: str = "stream") -> Dict[str, Any]:
+        """
+        Compact record (metadata + full format table) for a video. One
+        extraction serves /info, /formats, /stream and /download until the
+        stream URLs expire.
+        """
+        video_id = youtube_utils.extract_video_id(url)
+        if not video_id:
+            raise ValueError("Invalid YouTube URL")
+        
+        record = await YouTubeDownloader.get_cached_record(video_id)
+        if record:
+            return record
+        
+        unavailable = await YouTubeDownloader.get_unavailable(video_id)
+        if unavailable:
+            raise unavailable
+        
+        return await single_flight.do(
+            f"record:{video_id}",
+            lambda: YouTubeDownloader._extract_record(url, video_id, endpoint)
+        )
+    
+    @staticmethod
+    async def _extract_record(url: str, video_id: str, endpoint: str) -> Dict[str, Any]:
+        logger.info(f"🔍 Extracting record: {video_id}")
+        
+        # One player client per attempt, in configured order, so each client's
+        # breaker tracks its own outcome and a broken client is skipped outright
+        record = None
+        timed_out = False
+        for client in player_clients():
+            breaker = circuit_breakers.get(f"client:{client}")
+            if not breaker.allow():
+                continue
+            
+            identity = identity_pool.acquire()
+            error = None
+            start_time = time.time()
+            try:
+                if config.EXTRACTION_BACKEND == "process":
+                    record = await extraction_executor.run_process(
+                        endpoint, resolve_record, url, "video", "best", video_id, None, client, identity
+                    )
+                else:
+                    ydl_opts = build_ydl_options("video", "best", player_client=client, identity=identity)
+                    record = await extraction_executor.run(endpoint, extract_record, ydl_opts, url, video_id)
+            except asyncio.CancelledError:
+                breaker.release()
+                raise
+            except VideoUnavailable as e:
+                # No other player client will fix this; fail fast from now on
+                breaker.release()
+                identity_pool.record(identity, True, time.time() - start_time)
+                await YouTubeDownloader.mark_unavailable(video_id, e)
+                raise
+            except IdentityThrottled as e:
+                # Leave the client's breaker alone; the next attempt gets another identity
+                logger.error(f"Player client {client} throttled as {identity['name']}: {e}")
+                breaker.release()
+                identity_pool.record(identity, False, time.time() - start_time, e)
+                continue
+            except Exception as e:
+                logger.error(f"Player client {client} failed as {identity['name']}: {e}")
+                timed_out = isinstance(e, TimeoutError)
+                error = e
+                record = None
+            
+            identity_pool.record(identity, bool(record and record['formats']), time.time() - start_time, error)
+            if timed_out:
+                # YTDLP_TIMEOUT bounds the whole request, not each client
+                breaker.record_failure()
+                break
+            if record and record['formats']:
+                breaker.record_success()
+                break
+            breaker.record_failure()
+            record = None
+        
+        if not record:
+            if timed_out:
+                raise ExtractionTimeout(f"Extraction timed out after {config.YTDLP_TIMEOUT}s")
+            raise ValueError("Could not extract video info")
+        
+        await cache.set(f"record:{video_id}", record)
+        return record
+
+    @staticmethod
+    async def refresh_video(video_id: str):
+        """Re-extract a video's record ahead of expiry (refresh-ahead)"""
+        url = f"https://www.youtube.com/watch?v={video_id}"
+        await single_flight.do(
+            f"record:{video_id}",
+            lambda: YouTubeDownloader._extract_record(url, video_id, "refresh")
+        )
+        
+        # Derived stream entries still hold the old URLs; they are re-derived
+        # from the fresh record (no extraction) on the next request
+        await cache.delete(cache.stream_key(video_id, "audio"))
+        for quality in VIDEO_QUALITIES:
+            await cache.delete(cache.stream_key(video_id, "video", quality))
+
 # Create downloader instance
 downloader = YouTubeDownloader()
 
+# Cache keys that hold googlevideo URLs and can be refreshed ahead of expiry
+_REFRESHABLE_KEY_PATTERNS = [
+    re.compile(r'^record:([\w-]{11})$'),
+    re.compile(r'^stream:([\w-]{11}):(?:video|audio):\w+$'),
+]
+
+def refresh_task_for(key: str):
+    """Map a hot cache key to its background refresh (None if not refreshable)"""
+    for pattern in _REFRESHABLE_KEY_PATTERNS:
+        match = pattern.match(key)
+        if match:
+            return downloader.refresh_video(match.group(1))
+    return None
+
+cache.refresher = refresh_task_for
+
 # API Endpoints
 
 @app.get("/")
@@ -390,6 +637,10 @@ async def root():
             "/info": "Get video info (GET, params: url)",
             "/search": "Search videos (GET, params: q, limit)",
             "/formats": "Get available formats (GET, params: url)",
+            "/playlist": "Expand a playlist, streamed as NDJSON (GET, params: url, cursor, page_size, pages)",
+            "/channel": "Expand a channel's videos, streamed as NDJSON (GET, params: url, cursor, page_size, pages)",
+            "/prefetch": "Warm the cache for upcoming videos (POST, body: video_ids, mode, quality)",
+            "/batch/resolve": "Resolve many videos, streamed as NDJSON (POST, body: urls, mode, quality)",
             "/download/video": "Download video (GET, params: url, quality)",
             "/download/audio": "Download audio (GET, params: url)",
             "/health": "Health check (GET)",
@@ -421,7 +672,7 @@ async def stream_video(
         result = await downloader.get_stream_info(url, "video", quality)
         
         if result['status'] != 'success':
-            raise HTTPException(status_code=500, detail=result.get('message', 'Stream error'))
+            raise HTTPException(status_code=error_status(result), detail=result.get('message', 'Stream error'))
         
         stream_url = result['stream_url']
         
@@ -434,7 +685,7 @@ async def stream_video(
         response.headers.update({
             "Accept-Ranges": "bytes",
             "Content-Type": "video/mp4",
-            "Cache-Control": "public, max-age=7200",
+            "Cache-Control": f"public, max-age={youtube_utils.stream_max_age(stream_url)}",
             "Access-Control-Allow-Origin": "*",
             "Access-Control-Expose-Headers": "Content-Length,Content-Range",
             "X-Video-Title": youtube_utils.clean_title(result.get('title', '')),
@@ -465,13 +716,15 @@ async def stream_audio(
     try:
         video_id = youtube_utils.extract_video_id(url)
         
+        from_cache = False
+        
         # Check cache if not forcing refresh
         if not force_refresh:
-            cache_key = f"audio:{video_id}"
-            cached_result = await cache.get(cache_key)
+            cached_result = await cache.get(cache.stream_key(video_id, "audio"))
             if cached_result and cached_result.get('status') == 'success':
                 logger.info(f"🎵 Using cached audio for {video_id}")
                 result = cached_result
+                from_cache = True
             else:
                 result = await downloader.get_audio_stream(url)
         else:
@@ -479,13 +732,13 @@ async def stream_audio(
         
         if result['status'] != 'success':
             # Try one more time without cookies if cookies method failed
-            if "cookies" in result.get('message', '').lower():
+            if not result.get('unavailable') and "cookies" in result.get('message', '').lower():
                 logger.info("🔄 Retrying without cookies...")
                 result = await downloader.get_audio_stream(url, use_cookies=False)
             
             if result['status'] != 'success':
                 raise HTTPException(
-                    status_code=500,
+                    status_code=error_status(result),
                     detail=f"Audio extraction failed: {result.get('message', 'Unknown error')}. "
                           f"Video may be age-restricted or region-locked. Try adding cookies.txt file."
                 )
@@ -501,7 +754,7 @@ async def stream_audio(
         response.headers.update({
             "Accept-Ranges": "bytes",
             "Content-Type": get_content_type(result.get('format', {}).get('ext', 'm4a')),
-            "Cache-Control": "public, max-age=86400",  # 24 hours
+            "Cache-Control": f"public, max-age={youtube_utils.stream_max_age(stream_url)}",
             "Access-Control-Allow-Origin": "*",
             "Access-Control-Expose-Headers": "*",
             "X-Audio-Title": youtube_utils.clean_title(result.get('title', '')),
@@ -513,10 +766,12 @@ async def stream_audio(
             "X-Stream-Url-Hash": hashlib.md5(stream_url.encode()).hexdigest()[:8]
         })
         
+        if not from_cache:
+            response.headers["X-Extraction-Time-Saved"] = str(result.get('time_saved', 0.0))
+        
         # Cache successful result
         if result['status'] == 'success':
-            cache_key = f"audio:{video_id}"
-            await cache.set(cache_key, result)
+            await cache.set(cache.stream_key(video_id, "audio"), result)
         
         return response
         
@@ -527,6 +782,46 @@ async def stream_audio(
         raise HTTPException(status_code=500, detail=f"Audio streaming error: {str(e)}")
 
 
+def render_json(payload: Any) -> Dict[str, str]:
+    """Serialize a payload once, with a strong ETag derived from its bytes"""
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+    return {'etag': f'"{hashlib.sha1(body.encode()).hexdigest()}"', 'body': body}
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match check (weak comparison, as RFC 9110 specifies for GET)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    for tag in header.split(","):
+        tag = tag.strip()
+        if (tag[2:] if tag.startswith("W/") else tag) == etag:
+            return True
+    return False
+
+def conditional_response(request: Request, etag: str, max_age: float,
+                         body: Optional[str] = None, payload: Any = None) -> Response:
+    """
+    304 if the client already holds etag, else the JSON body (payload is
+    only serialized when no pre-rendered body is given and it is needed)
+    """
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={int(max_age)}",
+    }
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    if body is None:
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def error_status(result: Dict[str, Any]) -> int:
+    """HTTP status for a failed extraction result"""
+    if result.get('unavailable'):
+        return UNAVAILABLE_STATUS.get(result['unavailable'], 404)
+    return 504 if result.get('timed_out') else 500
+
 def get_content_type(ext: str) -> str:
     """Get content type based on file extension"""
     content_types = {
@@ -541,8 +836,58 @@ def get_content_type(ext: str) -> str:
     }
     return content_types.get(ext.lower(), 'audio/mpeg')
 
+async def fetch_video_info(url: str, video_id: str) -> Dict[str, str]:
+    """Build (and cache) the rendered /info payload from the shared video record"""
+    # Only VideoUnavailable means the video is gone (404/403/451); any other
+    # failure is transient and surfaces as a 500/504 from the endpoint
+    record = await downloader.get_video_record(url, endpoint="info")
+    
+    # Format response
+    video_info = {
+        'video_id': video_id,
+        'title': record.get('title'),
+        'description': record.get('description', ''),
+        'duration': record.get('duration'),
+        'duration_formatted': youtube_utils.format_duration(record.get('duration') or 0),
+        'thumbnail': record.get('thumbnail'),
+        'channel': record.get('channel'),
+        'channel_id': record.get('channel_id'),
+        'view_count': record.get('view_count'),
+        'like_count': record.get('like_count'),
+        'upload_date': record.get('upload_date'),
+        'categories': record.get('categories', []),
+        'tags': record.get('tags', []),
+        'age_limit': record.get('age_limit', 0),
+        'is_live': record.get('is_live', False),
+        'formats_count': len(record['formats']),
+        'webpage_url': record.get('webpage_url'),
+    }
+    
+    # Get available formats summary
+    formats_summary = []
+    for fmt in record['formats']:
+        if fmt.get('filesize') or fmt.get('filesize_approx'):
+            formats_summary.append({
+                'format_id': fmt.get('format_id'),
+                'ext': fmt.get('ext'),
+                'resolution': fmt.get('resolution', 'N/A'),
+                'filesize': fmt.get('filesize') or fmt.get('filesize_approx'),
+                'vcodec': fmt.get('vcodec', 'none'),
+                'acodec': fmt.get('acodec', 'none'),
+                'format_note': fmt.get('format_note', '')
+            })
+    
+    video_info['formats'] = formats_summary[:20]  # Limit to 20 formats
+    
+    # Cache the rendered info, so repeat requests skip serialization
+    rendered = render_json(video_info)
+    await cache.set(f"info:{video_id}", rendered)
+    
+    return rendered
+
 @app.get("/info")
 async def get_video_info(
+    request: Request,
     url: str = Query(..., description="YouTube video URL")
 ):
     """Get detailed video information"""
@@ -554,74 +899,39 @@ async def get_video_info(
         
         # Check cache
         cache_key = f"info:{video_id}"
-        cached_info = await cache.get(cache_key)
-        if cached_info:
-            return cached_info
-        
-        ydl_opts = {
-            'quiet': True,
-            'no_warnings': True,
-            'extract_flat': False,
-            'skip_download': True,
-        }
+        rendered = await cache.get(cache_key)
+        if not rendered or 'etag' not in rendered:
+            rendered = await single_flight.do(cache_key, lambda: fetch_video_info(url, video_id))
         
-        if config.COOKIES_FILE and os.path.exists(config.COOKIES_FILE):
-            ydl_opts['cookiefile'] = config.COOKIES_FILE
+        return conditional_response(request, rendered['etag'], await cache.ttl(cache_key), rendered['body'])
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            
-            if not info:
-                raise HTTPException(status_code=404, detail="Video not found")
-            
-            # Format response
-            video_info = {
-                'video_id': video_id,
-                'title': info.get('title'),
-                'description': info.get('description', '')[:500] + '...' if info.get('description') else '',
-                'duration': info.get('duration'),
-                'duration_formatted': youtube_utils.format_duration(info.get('duration', 0)),
-                'thumbnail': info.get('thumbnail'),
-                'channel': info.get('channel'),
-                'channel_id': info.get('channel_id'),
-                'view_count': info.get('view_count'),
-                'like_count': info.get('like_count'),
-                'upload_date': info.get('upload_date'),
-                'categories': info.get('categories', []),
-                'tags': info.get('tags', [])[:10],
-                'age_limit': info.get('age_limit', 0),
-                'is_live': info.get('is_live', False),
-                'formats_count': len(info.get('formats', [])),
-                'webpage_url': info.get('webpage_url'),
-            }
-            
-            # Get available formats summary
-            formats_summary = []
-            for fmt in info.get('formats', []):
-                if fmt.get('filesize') or fmt.get('filesize_approx'):
-                    formats_summary.append({
-                        'format_id': fmt.get('format_id'),
-                        'ext': fmt.get('ext'),
-                        'resolution': fmt.get('resolution', 'N/A'),
-                        'filesize': fmt.get('filesize') or fmt.get('filesize_approx'),
-                        'vcodec': fmt.get('vcodec', 'none'),
-                        'acodec': fmt.get('acodec', 'none'),
-                        'format_note': fmt.get('format_note', '')
-                    })
-            
-            video_info['formats'] = formats_summary[:20]  # Limit to 20 formats
-            
-            # Cache the info
-            await cache.set(cache_key, video_info)
-            
-            return video_info
-            
+    except HTTPException:
+        raise
+    except VideoUnavailable as e:
+        raise HTTPException(status_code=e.status, detail=str(e))
+    except TimeoutError as e:
+        logger.error(f"Info timeout: {e}")
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         logger.error(f"Info error: {e}")
         raise HTTPException(status_code=500, detail=f"Error getting info: {str(e)}")
 
+def search_response(request: Request, q: str, entry: Dict[str, Any], limit: int, max_age: float) -> Response:
+    """Conditional /search response sliced from a cached search entry"""
+    # The entry's ETag covers its results; the response also echoes q and limit
+    key = f"{entry['etag']}:{q}:{limit}"
+    etag = f'"{hashlib.sha1(key.encode()).hexdigest()}"'
+    results = entry['results'][:limit]
+    return conditional_response(request, etag, max_age, payload={
+        'success': True,
+        'query': q,
+        'count': len(results),
+        'results': results
+    })
+
 @app.get("/search")
 async def search_videos(
+    request: Request,
     q: str = Query(..., description="Search query"),
     limit: int = Query(10, ge=1, le=50, description="Number of results (1-50)")
 ):
@@ -635,54 +945,61 @@ async def search_videos(
         }
     
     try:
-        # Check cache
-        cache_key = f"search:{q}:{limit}"
-        cached_results = await cache.get(cache_key)
-        if cached_results:
-            cached_results["success"] = True
-            return cached_results
+        # One entry per normalized query, holding the most results fetched so
+        # far; smaller limits are served by slicing it
+        cache_key = f"search:{youtube_utils.normalize_query(q)}"
+        cached = await search_cache.get(cache_key)
+        if cached and 'etag' in cached and (cached['fetched'] >= limit or cached['exhausted']):
+            return search_response(request, q, cached, limit, await search_cache.ttl(cache_key))
+        
+        # A results page costs the same for any limit up to its size
+        fetch = max(limit, config.SEARCH_MIN_FETCH)
         
         ydl_opts = {
             'quiet': True,
             'no_warnings': True,
             'extract_flat': True,
-            'default_search': f'ytsearch{limit}',
+            'default_search': f'ytsearch{fetch}',
             'skip_download': True,
         }
         
-        if config.COOKIES_FILE and os.path.exists(config.COOKIES_FILE):
-            ydl_opts['cookiefile'] = config.COOKIES_FILE
+        identity = identity_pool.acquire()
+        identity_options(ydl_opts, identity)
+        
+        start_time = time.time()
+        try:
+            info = await extraction_executor.run("search", run_extraction, ydl_opts, f"ytsearch{fetch}:{q}")
+        except Exception as e:
+            identity_pool.record(identity, False, time.time() - start_time, e)
+            raise
+        identity_pool.record(identity, bool(info), time.time() - start_time)
+        
+        results = []
+        for entry in info.get('entries', []):
+            if entry and entry.get('id'):
+                results.append({
+                    'video_id': entry.get('id'),
+                    'title': entry.get('title', 'No Title'),
+                    'duration': entry.get('duration'),
+                    'duration_formatted': youtube_utils.format_duration(entry.get('duration', 0)),
+                    'thumbnail': entry.get('thumbnail'),
+                    'channel': entry.get('channel'),
+                    'view_count': entry.get('view_count'),
+                    'upload_date': entry.get('upload_date'),
+                    'url': f"https://youtube.com/watch?v={entry.get('id')}",
+                })
+        
+        # Cache results
+        entry = {
+            'fetched': fetch,
+            'exhausted': len(results) < fetch,
+            'results': results,
+            'etag': render_json(results)['etag'],
+        }
+        await search_cache.set(cache_key, entry)
+        
+        return search_response(request, q, entry, limit, await search_cache.ttl(cache_key))
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(f"ytsearch{limit}:{q}", download=False)
-            
-            results = []
-            for entry in info.get('entries', []):
-                if entry and entry.get('id'):
-                    results.append({
-                        'video_id': entry.get('id'),
-                        'title': entry.get('title', 'No Title'),
-                        'duration': entry.get('duration'),
-                        'duration_formatted': youtube_utils.format_duration(entry.get('duration', 0)),
-                        'thumbnail': entry.get('thumbnail'),
-                        'channel': entry.get('channel'),
-                        'view_count': entry.get('view_count'),
-                        'upload_date': entry.get('upload_date'),
-                        'url': f"https://youtube.com/watch?v={entry.get('id')}",
-                    })
-            
-            response = {
-                'success': True,
-                'query': q,
-                'count': len(results),
-                'results': results[:limit]
-            }
-            
-            # Cache results
-            await cache.set(cache_key, response)
-            
-            return response
-            
     except Exception as e:
         logger.error(f"Search error: {e}")
         return {
@@ -694,6 +1011,7 @@ async def search_videos(
 
 @app.get("/formats")
 async def get_available_formats(
+    request: Request,
     url: str = Query(..., description="YouTube video URL")
 ):
     """Get all available formats for a video"""
@@ -703,52 +1021,309 @@ async def get_available_formats(
     try:
         video_id = youtube_utils.extract_video_id(url)
         
+        cache_key = f"formats:{video_id}"
+        rendered = await cache.get(cache_key)
+        if rendered:
+            return conditional_response(request, rendered['etag'], await cache.ttl(cache_key), rendered['body'])
+        
+        # Derived from the shared video record, no extraction of its own
+        info = await downloader.get_video_record(url, endpoint="formats")
+        
+        formats = []
+        for fmt in info['formats']:
+            if fmt.get('filesize') or fmt.get('filesize_approx'):
+                formats.append({
+                    'format_id': fmt.get('format_id'),
+                    'ext': fmt.get('ext'),
+                    'resolution': fmt.get('resolution', 'N/A'),
+                    'filesize': fmt.get('filesize') or fmt.get('filesize_approx'),
+                    'filesize_mb': round((fmt.get('filesize') or fmt.get('filesize_approx') or 0) / (1024 * 1024), 2),
+                    'vcodec': fmt.get('vcodec', 'none'),
+                    'acodec': fmt.get('acodec', 'none'),
+                    'format_note': fmt.get('format_note', ''),
+                    'fps': fmt.get('fps'),
+                    'tbr': fmt.get('tbr'),  # Average bitrate
+                    'protocol': fmt.get('protocol', '')
+                })
+        
+        # Sort by resolution/filesize
+        formats.sort(key=lambda x: (
+            x.get('resolution', '0x0'),
+            x.get('filesize', 0)
+        ), reverse=True)
+        
+        # Rendered once and kept as long as the record it was derived from
+        rendered = render_json({
+            'video_id': video_id,
+            'title': info.get('title', 'Unknown'),
+            'total_formats': len(formats),
+            'formats': formats
+        })
+        max_age = await cache.ttl(f"record:{video_id}")
+        if max_age > 0:
+            await cache.set(cache_key, rendered, ttl=max_age)
+        
+        return conditional_response(request, rendered['etag'], max_age, rendered['body'])
+        
+    except VideoUnavailable as e:
+        raise HTTPException(status_code=e.status, detail=str(e))
+    except TimeoutError as e:
+        logger.error(f"Formats timeout: {e}")
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        logger.error(f"Formats error: {e}")
+        raise HTTPException(status_code=500, detail=f"Error getting formats: {str(e)}")
+
+async def get_flat_page(kind: str, source_id: str, source_url: str, start: int, size: int) -> Dict[str, Any]:
+    """One cached page of a flat playlist/channel listing"""
+    cache_key = f"{kind}:{source_id}:{start}:{size}"
+    page = await cache.get(cache_key)
+    if page:
+        return page
+    
+    async def fetch_page():
         ydl_opts = {
             'quiet': True,
             'no_warnings': True,
-            'listformats': True,
             'skip_download': True,
         }
         
-        if config.COOKIES_FILE and os.path.exists(config.COOKIES_FILE):
-            ydl_opts['cookiefile'] = config.COOKIES_FILE
+        identity = identity_pool.acquire()
+        identity_options(ydl_opts, identity)
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
+        start_time = time.time()
+        try:
+            page = await extraction_executor.run(
+                "playlist", extract_flat_page, ydl_opts, source_url, start, size
+            )
+        except Exception as e:
+            identity_pool.record(identity, False, time.time() - start_time, e)
+            raise
+        identity_pool.record(identity, True, time.time() - start_time)
+        await cache.set(cache_key, page)
+        return page
+    
+    return await single_flight.do(cache_key, fetch_page)
+
+def parse_cursor(cursor: Optional[str]) -> int:
+    """Cursor is the 1-based index of the next entry to return"""
+    if not cursor:
+        return 1
+    if not cursor.isdigit() or int(cursor) < 1:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return int(cursor)
+
+def stream_flat_listing(kind: str, source_id: str, source_url: str, start: int,
+                        page_size: int, pages: int) -> StreamingResponse:
+    """
+    Stream a playlist/channel listing as NDJSON: one header line, one line
+    per entry as each page arrives, then a cursor line for continuation
+    """
+    async def listing_lines():
+        position = start
+        header_sent = False
+        has_more = True
+        
+        for _ in range(pages):
+            try:
+                page = await get_flat_page(kind, source_id, source_url, position, page_size)
+            except Exception as e:
+                logger.error(f"{kind.capitalize()} page error: {e}")
+                yield json.dumps({'type': 'error', 'message': str(e), 'cursor': str(position)}) + "\n"
+                return
             
-            formats = []
-            for fmt in info.get('formats', []):
-                if fmt.get('filesize') or fmt.get('filesize_approx'):
-                    formats.append({
-                        'format_id': fmt.get('format_id'),
-                        'ext': fmt.get('ext'),
-                        'resolution': fmt.get('resolution', 'N/A'),
-                        'filesize': fmt.get('filesize') or fmt.get('filesize_approx'),
-                        'filesize_mb': round((fmt.get('filesize') or fmt.get('filesize_approx') or 0) / (1024 * 1024), 2),
-                        'vcodec': fmt.get('vcodec', 'none'),
-                        'acodec': fmt.get('acodec', 'none'),
-                        'format_note': fmt.get('format_note', ''),
-                        'fps': fmt.get('fps'),
-                        'tbr': fmt.get('tbr'),  # Average bitrate
-                        'protocol': fmt.get('protocol', '')
-                    })
+            if not header_sent:
+                yield json.dumps({
+                    'type': kind,
+                    'id': page.get('id') or source_id,
+                    'title': page.get('title'),
+                    'channel': page.get('channel'),
+                }) + "\n"
+                header_sent = True
             
-            # Sort by resolution/filesize
-            formats.sort(key=lambda x: (
-                x.get('resolution', '0x0'),
-                x.get('filesize', 0)
-            ), reverse=True)
+            for entry in page['entries']:
+                yield json.dumps({
+                    'type': 'entry',
+                    'index': position,
+                    **entry,
+                    'duration_formatted': youtube_utils.format_duration(int(entry.get('duration') or 0)),
+                }) + "\n"
+                position += 1
             
-            return {
-                'video_id': video_id,
-                'title': info.get('title', 'Unknown'),
-                'total_formats': len(formats),
-                'formats': formats
-            }
+            has_more = page['has_more']
+            if not has_more:
+                break
+        
+        yield json.dumps({'type': 'cursor', 'next_cursor': str(position) if has_more else None}) + "\n"
+    
+    return StreamingResponse(listing_lines(), media_type="application/x-ndjson")
+
+@app.get("/playlist")
+async def expand_playlist(
+    url: str = Query(..., description="YouTube playlist URL"),
+    cursor: Optional[str] = Query(None, description="Continuation cursor from a previous response"),
+    page_size: int = Query(config.PLAYLIST_PAGE_SIZE, ge=1, le=100, description="Entries per page"),
+    pages: int = Query(1, ge=1, le=config.PLAYLIST_MAX_PAGES, description="Pages to walk in this request")
+):
+    """Expand a playlist into its videos (NDJSON stream)"""
+    playlist_id = youtube_utils.extract_playlist_id(url)
+    if not youtube_utils.is_valid_youtube_url(url) or not playlist_id:
+        raise HTTPException(status_code=400, detail="Invalid YouTube playlist URL")
+    
+    return stream_flat_listing(
+        "playlist",
+        playlist_id,
+        f"https://www.youtube.com/playlist?list={playlist_id}",
+        parse_cursor(cursor),
+        page_size,
+        pages
+    )
+
+@app.get("/channel")
+async def expand_channel(
+    url: str = Query(..., description="YouTube channel URL"),
+    cursor: Optional[str] = Query(None, description="Continuation cursor from a previous response"),
+    page_size: int = Query(config.PLAYLIST_PAGE_SIZE, ge=1, le=100, description="Entries per page"),
+    pages: int = Query(1, ge=1, le=config.PLAYLIST_MAX_PAGES, description="Pages to walk in this request")
+):
+    """Expand a channel's uploaded videos (NDJSON stream)"""
+    channel_path = youtube_utils.extract_channel_path(url)
+    if not youtube_utils.is_valid_youtube_url(url) or not channel_path:
+        raise HTTPException(status_code=400, detail="Invalid YouTube channel URL")
+    
+    return stream_flat_listing(
+        "channel",
+        channel_path,
+        f"https://www.youtube.com/{channel_path}/videos",
+        parse_cursor(cursor),
+        page_size,
+        pages
+    )
+
+class BatchResolveRequest(BaseModel):
+    urls: List[str]
+    mode: str = "audio"
+    quality: str = "best"
+
+async def get_cached_stream_info(video_id: str, mode: str, quality: str) -> Optional[Dict[str, Any]]:
+    """Cached stream result for a video, if any endpoint already resolved it"""
+    cached = await cache.get(cache.stream_key(video_id, mode, quality))
+    if cached and cached.get('status') == 'success':
+        return cached
+    return None
+
+@app.post("/batch/resolve")
+async def batch_resolve(batch: BatchResolveRequest):
+    """
+    Resolve many videos in one request
+    Streams one NDJSON line per URL as soon as it is ready (cached first)
+    """
+    if batch.mode not in ["audio", "video"]:
+        raise HTTPException(status_code=400, detail="Invalid mode parameter")
+    
+    if batch.quality not in ["low", "medium", "high", "best"]:
+        raise HTTPException(status_code=400, detail="Invalid quality parameter")
+    
+    if len(batch.urls) > config.BATCH_MAX_URLS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many URLs (max {config.BATCH_MAX_URLS})"
+        )
+    
+    def ndjson_line(index: int, url: str, result: Dict[str, Any], cached: bool) -> str:
+        return json.dumps({'index': index, 'url': url, 'cached': cached, **result}) + "\n"
+    
+    async def resolve(index: int, url: str, semaphore: asyncio.Semaphore):
+        async with semaphore:
+            result = await downloader.get_stream_info(url, batch.mode, batch.quality)
+        return index, url, result
+    
+    async def result_lines():
+        semaphore = asyncio.Semaphore(config.BATCH_CONCURRENCY)
+        pending = []
+        
+        try:
+            # Invalid and cached URLs are answered right away
+            for index, url in enumerate(batch.urls):
+                if not youtube_utils.is_valid_youtube_url(url):
+                    yield ndjson_line(index, url, {'status': 'error', 'message': 'Invalid YouTube URL'}, False)
+                    continue
+                
+                video_id = youtube_utils.extract_video_id(url)
+                cached = await get_cached_stream_info(video_id, batch.mode, batch.quality) if video_id else None
+                if cached:
+                    yield ndjson_line(index, url, cached, True)
+                    continue
+                
+                pending.append(asyncio.ensure_future(resolve(index, url, semaphore)))
             
-    except Exception as e:
-        logger.error(f"Formats error: {e}")
-        raise HTTPException(status_code=500, detail=f"Error getting formats: {str(e)}")
+            # The rest stream back in completion order
+            for next_done in asyncio.as_completed(pending):
+                index, url, result = await next_done
+                yield ndjson_line(index, url, result, False)
+        finally:
+            # Client went away: stop resolving what nobody will read
+            for task in pending:
+                task.cancel()
+    
+    return StreamingResponse(
+        result_lines(),
+        media_type="application/x-ndjson",
+        headers={'Cache-Control': 'no-store'}
+    )
+
+class PrefetchRequest(BaseModel):
+    video_ids: List[str]
+    mode: str = "audio"
+    quality: str = "best"
+
+async def prefetch_video(item: Tuple[str, str, str]) -> bool:
+    """Resolve one video through the normal path so later requests hit the cache"""
+    video_id, mode, quality = item
+    url = f"https://www.youtube.com/watch?v={video_id}"
+    
+    # Caches under the same canonical key /stream and /download read
+    result = await downloader.get_stream_info(url, mode, quality)
+    return result['status'] == 'success'
+
+@app.post("/prefetch")
+async def prefetch(request: PrefetchRequest):
+    """
+    Warm the cache for videos that will be played soon
+    Resolution happens in the background at low priority
+    """
+    if request.mode not in ["audio", "video"]:
+        raise HTTPException(status_code=400, detail="Invalid mode parameter")
+    
+    if request.quality not in ["low", "medium", "high", "best"]:
+        raise HTTPException(status_code=400, detail="Invalid quality parameter")
+    
+    if len(request.video_ids) > config.BATCH_MAX_URLS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many video IDs (max {config.BATCH_MAX_URLS})"
+        )
+    
+    queued, already_cached, failed = [], [], []
+    for video_id in dict.fromkeys(request.video_ids):
+        if not re.fullmatch(r'[\w-]{11}', video_id):
+            failed.append(video_id)
+        elif await get_cached_stream_info(video_id, request.mode, request.quality):
+            already_cached.append(video_id)
+        elif prefetch_queue.submit(
+            cache.stream_key(video_id, request.mode, request.quality),
+            (video_id, request.mode, request.quality)
+        ):
+            queued.append(video_id)
+        else:
+            failed.append(video_id)
+    
+    return {
+        "queued": len(queued),
+        "already_cached": len(already_cached),
+        "failed": len(failed),
+        "failed_ids": failed
+    }
 
 @app.get("/download/video")
 async def download_video(
@@ -766,7 +1341,7 @@ async def download_video(
         result = await downloader.get_stream_info(url, "video", quality)
         
         if result['status'] != 'success':
-            raise HTTPException(status_code=500, detail=result.get('message', 'Download error'))
+            raise HTTPException(status_code=error_status(result), detail=result.get('message', 'Download error'))
         
         stream_url = result['stream_url']
         video_title = youtube_utils.clean_title(result.get('title', 'video'))
@@ -799,6 +1374,8 @@ async def download_video(
             }
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Download video error: {e}")
         raise HTTPException(status_code=500, detail=f"Download error: {str(e)}")
@@ -815,7 +1392,7 @@ async def download_audio(
         result = await downloader.get_stream_info(url, "audio")
         
         if result['status'] != 'success':
-            raise HTTPException(status_code=500, detail=result.get('message', 'Download error'))
+            raise HTTPException(status_code=error_status(result), detail=result.get('message', 'Download error'))
         
         stream_url = result['stream_url']
         audio_title = youtube_utils.clean_title(result.get('title', 'audio'))
@@ -843,10 +1420,46 @@ async def download_audio(
             }
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Download audio error: {e}")
         raise HTTPException(status_code=500, detail=f"Download error: {str(e)}")
 
+@app.get("/thumbnail/{video_id}")
+async def get_thumbnail(
+    request: Request,
+    video_id: str,
+    width: Optional[int] = Query(None, description=f"Resized width: one of {', '.join(map(str, config.THUMBNAIL_WIDTHS))}")
+):
+    """Video thumbnail proxied through the local disk cache"""
+    if not re.fullmatch(r'[\w-]{11}', video_id):
+        raise HTTPException(status_code=400, detail="Invalid video ID")
+    if width is not None and width not in config.THUMBNAIL_WIDTHS:
+        raise HTTPException(status_code=400, detail=f"Width must be one of {list(config.THUMBNAIL_WIDTHS)}")
+    
+    try:
+        path = await single_flight.do(
+            f"thumbnail:{video_id}:{width}",
+            lambda: thumbnail_cache.get(video_id, width)
+        )
+        stat = os.stat(path)
+    except ThumbnailNotFound:
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
+    except Exception as e:
+        logger.error(f"Thumbnail error for {video_id}: {e}")
+        raise HTTPException(status_code=502, detail=f"Thumbnail error: {str(e)}")
+    
+    etag = f'"{video_id}-{width or 0}-{int(stat.st_mtime)}-{stat.st_size}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={config.THUMBNAIL_MAX_AGE}",
+    }
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    # Starlette 0.27's FileResponse streams the file in chunks (no sendfile)
+    return FileResponse(path, media_type="image/jpeg", headers=headers, stat_result=stat)
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -855,8 +1468,10 @@ async def health_check():
         "timestamp": time.time(),
         "service": "YouTube Streaming API",
         "version": "2.0.0",
-        "cache_size": len(cache.cache),
-        "rate_limits": len(rate_limiter.requests)
+        "cache_size": len(cache),
+        "rate_limits": len(rate_limiter.requests),
+        "extraction_queue": extraction_executor.queued,
+        "circuit_breakers": circuit_breakers.states()
     }
 
 @app.get("/stats")
@@ -867,15 +1482,59 @@ async def api_statistics():
         "requests_by_endpoint": _request_count,
         "cache_hits": getattr(cache, 'hits', 0),
         "cache_misses": getattr(cache, 'misses', 0),
-        "cache_size": len(cache.cache),
+        "cache_size": len(cache),
+        "cache_legacy_hits": cache.legacy_hits,
+        "cache_evictions": cache.evictions,
+        "cache_expirations": cache.expirations,
+        "cache_memory": cache.memory_stats(),
+        "cache_l2": {**cache.l2.snapshot(), "promoted": cache.l2_hits} if cache.l2 else None,
+        "cache_namespaces": cache.namespace_snapshot(),
+        "search_cache": {
+            "hits": search_cache.hits,
+            "misses": search_cache.misses,
+            "size": len(search_cache),
+            "memory": search_cache.memory_stats(),
+            "namespaces": search_cache.namespace_snapshot(),
+        },
+        "cache_refresh": {**cache.refresh_stats, "in_progress": len(cache.refreshing)},
         "uptime": time.time() - getattr(app, 'start_time', time.time()),
-        "rate_limited_ips": len(rate_limiter.requests)
+        "rate_limited_ips": len(rate_limiter.requests),
+        "extraction": extraction_executor.stats(),
+        "single_flight": single_flight.stats(),
+        "circuit_breakers": circuit_breakers.snapshot(),
+        "identities": identity_pool.snapshot(),
+        "prefetch": prefetch_queue.snapshot(),
+        "thumbnails": thumbnail_cache.snapshot(),
+        "negative_cache": YouTubeDownloader.negative_stats,
+        "audio_hedging": {
+            **YouTubeDownloader.hedge_stats,
+            "time_saved_total": round(YouTubeDownloader.hedge_stats['time_saved_total'], 3)
+        }
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Cache metrics in Prometheus text format"""
+    return Response(
+        content=render_metrics(cache, search_cache),
+        media_type="text/plain; version=0.0.4"
+    )
+
+@app.get("/audio-methods")
+async def audio_method_ranking():
+    """Current audio extraction method ranking (admin endpoint)"""
+    return {
+        "hedging": config.AUDIO_HEDGE_ENABLED,
+        "explore_rate": config.AUDIO_METHOD_EXPLORE_RATE,
+        "explored": method_ranker.explored,
+        "ranking": method_ranker.snapshot(AUDIO_METHODS)
     }
 
 @app.get("/clear-cache")
 async def clear_cache():
     """Clear all cache (admin endpoint)"""
-    cache.cache.clear()
+    await cache.clear()
+    await search_cache.clear()
     return {"status": "success", "message": "Cache cleared"}
 
 # WebSocket endpoint for real-time updates
@@ -0,0 +1,45 @@
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+pytest.importorskip("yt_dlp")
+
+from extraction import create_ydl
+
+
+class RecordingHandler(BaseHTTPRequestHandler):
+    cookies = []
+
+    def do_GET(self):
+        RecordingHandler.cookies.append(self.headers.get("Cookie"))
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = HTTPServer(("127.0.0.1", 0), RecordingHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    RecordingHandler.cookies = []
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_shared_cookie_jar_is_sent(server, tmp_path):
+    cookie_file = tmp_path / "cookies.txt"
+    cookie_file.write_text(
+        "# Netscape HTTP Cookie File\n"
+        "127.0.0.1\tFALSE\t/\tFALSE\t2147483647\tSID\tshared-jar\n"
+    )
+
+    with create_ydl({'quiet': True, 'cookiefile': str(cookie_file)}) as ydl:
+        ydl.urlopen(f"http://127.0.0.1:{server.server_port}/").read()
+
+    assert RecordingHandler.cookies == ["SID=shared-jar"]
@@ -1,14 +1,29 @@
+import os
 import re
+import sys
 import time
+import sqlite3
+import unicodedata
+from bisect import bisect_left
 import hashlib
 import json
 import asyncio
-from typing import Dict, List, Optional, Tuple, Any
+import random
+import logging
+import multiprocessing
+import tempfile
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, Any
 from urllib.parse import urlparse, parse_qs
 import aiohttp
 from datetime import datetime, timedelta
 
 from config import config
+from extraction import IdentityThrottled, configured_identities, cookie_store_for, is_throttle_message, stream_url_expiry, worker_loop
+
+logger = logging.getLogger(__name__)
 
 class YouTubeUtils:
     @staticmethod
@@ -30,28 +45,48 @@ class YouTubeUtils:
     
     @staticmethod
     def extract_video_id(url: str) -> Optional[str]:
-        """Extract video ID from URL"""
-        # Common patterns
-        patterns = {
-            'v': r'(?:v=|\/)([\w-]{11})',
-            'embed': r'embed\/([\w-]{11})',
-            'shorts': r'shorts\/([\w-]{11})',
-            'live': r'live\/([\w-]{11})',
-            'youtu.be': r'youtu\.be\/([\w-]{11})'
-        }
+        """
+        Canonical 11-character video ID for any form of video URL (watch?v=,
+        youtu.be, shorts, embed, live, m./music. hosts, extra params like &t=)
+        or a bare ID, so every form maps to the same cache keys
+        """
+        url = (url or '').strip()
+        if re.fullmatch(r'[\w-]{11}', url):
+            return url
         
-        for key, pattern in patterns.items():
-            match = re.search(pattern, url)
-            if match:
-                return match.group(1)
+        parsed = urlparse(url if '://' in url else f"https://{url}")
+        host = (parsed.hostname or '').lower()
+        segments = [segment for segment in parsed.path.split('/') if segment]
         
-        # Try parsing query parameters
-        parsed = urlparse(url)
-        if parsed.hostname and 'youtube.com' in parsed.hostname:
+        candidate = None
+        if host == 'youtu.be' or host.endswith('.youtu.be'):
+            candidate = segments[0] if segments else None
+        elif 'youtube' in host:
             query_params = parse_qs(parsed.query)
-            if 'v' in query_params and query_params['v'][0]:
-                return query_params['v'][0]
+            if query_params.get('v'):
+                candidate = query_params['v'][0]
+            elif len(segments) >= 2 and segments[0] in ('embed', 'shorts', 'live', 'v', 'e'):
+                # /embed/videoseries?list=... is a playlist embed, not a video
+                candidate = segments[1] if segments[1] != 'videoseries' else None
         
+        if candidate and re.fullmatch(r'[\w-]{11}', candidate):
+            return candidate
+        return None
+    
+    @staticmethod
+    def extract_playlist_id(url: str) -> Optional[str]:
+        """Extract playlist ID (list= parameter) from URL"""
+        query_params = parse_qs(urlparse(url).query)
+        if 'list' in query_params and re.fullmatch(r'[\w-]+', query_params['list'][0]):
+            return query_params['list'][0]
+        return None
+    
+    @staticmethod
+    def extract_channel_path(url: str) -> Optional[str]:
+        """Extract channel path (@handle, channel/UC..., c/name, user/name) from URL"""
+        match = re.search(r'youtube\.com/(@[\w.-]+|(?:channel|c|user)/[\w.-]+)', url, re.IGNORECASE)
+        if match:
+            return match.group(1)
         return None
     
     @staticmethod
@@ -80,6 +115,19 @@ class YouTubeUtils:
         else:
             return f"{minutes}:{secs:02d}"
     
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """Search query as a cache key: Unicode-normalized, case-folded, single-spaced"""
+        return ' '.join(unicodedata.normalize('NFKC', query).casefold().split())
+    
+    @staticmethod
+    def stream_max_age(stream_url: str) -> int:
+        """Seconds a client may cache a redirect to stream_url before it expires"""
+        expires_at = stream_url_expiry(stream_url)
+        if not expires_at:
+            return config.CACHE_TTL
+        return max(0, int(expires_at - time.time() - config.STREAM_EXPIRY_MARGIN))
+    
     @staticmethod
     def search_youtube_sync(query: str, limit: int = 10) -> List[Dict[str, Any]]:
         """
@@ -130,11 +178,10 @@ class YouTubeUtils:
         """
         Asynchronous wrapper for YouTube search
         """
-        # Run synchronous search in thread pool
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(
-            None, 
-            YouTubeUtils.search_youtube_sync, 
+        # Run synchronous search in the extraction executor
+        return await extraction_executor.run(
+            "search",
+            YouTubeUtils.search_youtube_sync,
             query, limit
         )
     
@@ -187,49 +234,1694 @@ class RateLimiter:
             self.requests[client_ip] = current_time
             return True
 
-class Cache:
-    """Simple in-memory cache"""
+def approx_size(value: Any) -> int:
+    """Approximate resident bytes of a value, walking dicts, lists and tuples"""
+    size = 0
+    stack = [value]
+    while stack:
+        obj = stack.pop()
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set)):
+            stack.extend(obj)
+    return size
+
+class CacheBackend:
+    """Second cache tier behind Cache, with writes buffered and flushed in batches"""
+    
+    name = "backend"
+    shared = False
     
     def __init__(self):
-        self.cache = {}
-        self.lock = asyncio.Lock()
+        self.pending: Dict[str, Optional[Tuple[float, float, Any]]] = {}  # None = delete
+        self.clear_pending = False
+        self.flusher: Optional[asyncio.Task] = None
+        self.stats = {
+            'reads': 0,
+            'hits': 0,
+            'writes': 0,
+            'flushes': 0,
+            'errors': 0,
+        }
+    
+    async def _open(self):
+        pass
+    
+    async def _load(self) -> List[Tuple[str, float, float, Any]]:
+        """Live entries to warm L1 with, oldest first"""
+        return []
+    
+    async def _read(self, key: str) -> Optional[Tuple[float, float, Any]]:
+        raise NotImplementedError
+    
+    async def _write(self, batch: Dict[str, Optional[Tuple[float, float, Any]]], clear: bool):
+        raise NotImplementedError
+    
+    async def _close(self):
+        pass
+    
+    async def purge_expired(self):
+        """Drop expired entries (backends with native expiry do nothing)"""
+    
+    async def start(self) -> List[Tuple[str, float, float, Any]]:
+        """Open the backend and return its entries for warming L1"""
+        await self._open()
+        rows = await self._load()
+        self.flusher = asyncio.ensure_future(self._flush_loop())
+        return rows
+    
+    async def get(self, key: str) -> Optional[Tuple[float, float, Any]]:
+        """(stored_at, expires_at, value) for key, or None"""
+        if key in self.pending:
+            return self.pending[key]
+        self.stats['reads'] += 1
+        try:
+            entry = await self._read(key)
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.warning(f"⚠️ Cache {self.name} read error for {key}: {e}")
+            return None
+        if entry is not None:
+            self.stats['hits'] += 1
+        return entry
+    
+    def put(self, key: str, stored_at: float, expires_at: float, value: Any):
+        self.pending[key] = (stored_at, expires_at, value)
+    
+    def delete(self, key: str):
+        self.pending[key] = None
+    
+    def clear(self):
+        self.pending = {}
+        self.clear_pending = True
+    
+    async def flush(self):
+        """Write buffered changes to the backend"""
+        if not self.pending and not self.clear_pending:
+            return
+        batch, clear = self.pending, self.clear_pending
+        self.pending, self.clear_pending = {}, False
+        await self._write(batch, clear)
+        self.stats['flushes'] += 1
+    
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(config.CACHE_L2_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.warning(f"⚠️ Cache {self.name} flush error: {e}")
+    
+    async def close(self):
+        """Flush outstanding writes and close the backend"""
+        if self.flusher is not None:
+            self.flusher.cancel()
+            self.flusher = None
+        await self.flush()
+        await self._close()
+    
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            'backend': self.name,
+            'shared': self.shared,
+            'pending': len(self.pending),
+        }
+
+class DiskCache(CacheBackend):
+    """Persistent SQLite L2 under CACHE_DIR, with all disk I/O on one thread"""
+    
+    name = "sqlite"
+    
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self.conn: Optional[sqlite3.Connection] = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache-l2")
+        self.keys: set = set()  # Keys on disk or pending; misses for anything else skip the disk
+    
+    async def _call(self, func: Callable, *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+    
+    def _open_db(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, stored_at REAL, expires_at REAL, value TEXT)"
+        )
+        self.conn.commit()
+    
+    def _load_rows(self, now: float) -> List[Tuple[str, float, float, Any]]:
+        self.conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+        self.conn.commit()
+        rows = []
+        for key, stored_at, expires_at, value in self.conn.execute(
+                "SELECT key, stored_at, expires_at, value FROM cache ORDER BY stored_at"):
+            try:
+                rows.append((key, stored_at, expires_at, json.loads(value)))
+            except ValueError:
+                self.stats['errors'] += 1
+        return rows
+    
+    def _read_row(self, key: str) -> Optional[Tuple[float, float, Any]]:
+        row = self.conn.execute(
+            "SELECT stored_at, expires_at, value FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], json.loads(row[2])
+    
+    def _write_batch(self, batch: Dict[str, Optional[Tuple[float, float, Any]]], clear: bool):
+        if clear:
+            self.conn.execute("DELETE FROM cache")
+        for key, entry in batch.items():
+            if entry is None:
+                self.conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                continue
+            try:
+                value = json.dumps(entry[2])
+            except (TypeError, ValueError):
+                self.stats['errors'] += 1
+                continue
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cache (key, stored_at, expires_at, value) VALUES (?, ?, ?, ?)",
+                (key, entry[0], entry[1], value)
+            )
+            self.stats['writes'] += 1
+        self.conn.commit()
+    
+    def _purge_rows(self, now: float):
+        self.conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+        self.conn.commit()
+    
+    async def _open(self):
+        await self._call(self._open_db)
+    
+    async def _load(self) -> List[Tuple[str, float, float, Any]]:
+        rows = await self._call(self._load_rows, time.time())
+        self.keys = {row[0] for row in rows}
+        return rows
+    
+    async def _read(self, key: str) -> Optional[Tuple[float, float, Any]]:
+        return await self._call(self._read_row, key)
+    
+    async def _write(self, batch: Dict[str, Optional[Tuple[float, float, Any]]], clear: bool):
+        await self._call(self._write_batch, batch, clear)
+    
+    async def _close(self):
+        await self._call(self.conn.close)
+        self.executor.shutdown(wait=True)
+    
+    async def purge_expired(self):
+        await self._call(self._purge_rows, time.time())
+    
+    async def get(self, key: str) -> Optional[Tuple[float, float, Any]]:
+        if key not in self.pending and key not in self.keys:
+            return None
+        return await super().get(key)
+    
+    def put(self, key: str, stored_at: float, expires_at: float, value: Any):
+        super().put(key, stored_at, expires_at, value)
+        self.keys.add(key)
+    
+    def delete(self, key: str):
+        if key in self.keys:
+            super().delete(key)
+            self.keys.discard(key)
+    
+    def clear(self):
+        super().clear()
+        self.keys = set()
+    
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **super().snapshot(),
+            'keys': len(self.keys),
+            'path': self.path,
+        }
+
+class RedisCache(CacheBackend):
+    """Shared L2 on a Redis-protocol server, seen by every worker and replica"""
+    
+    name = "redis"
+    shared = True
+    
+    def __init__(self, url: str, prefix: str = "ytapi:"):
+        super().__init__()
+        self.url = url
+        self.prefix = prefix
+        self.client = None
+    
+    async def _open(self):
+        import redis.asyncio as redis
+        
+        pool = redis.BlockingConnectionPool.from_url(
+            self.url,
+            max_connections=config.REDIS_POOL_SIZE,
+            timeout=config.REDIS_TIMEOUT,
+            socket_timeout=config.REDIS_TIMEOUT,
+        )
+        self.client = redis.Redis(connection_pool=pool)
+        await self.client.ping()
+    
+    async def _read(self, key: str) -> Optional[Tuple[float, float, Any]]:
+        raw = await self.client.get(self.prefix + key)
+        if raw is None:
+            return None
+        stored_at, expires_at, value = json.loads(raw)
+        return stored_at, expires_at, value
+    
+    async def _write(self, batch: Dict[str, Optional[Tuple[float, float, Any]]], clear: bool):
+        if clear:
+            await self._delete_prefix()
+        
+        now = time.time()
+        async with self.client.pipeline(transaction=False) as pipe:
+            for key, entry in batch.items():
+                if entry is None:
+                    pipe.delete(self.prefix + key)
+                    continue
+                ttl_ms = int((entry[1] - now) * 1000)
+                if ttl_ms <= 0:
+                    continue
+                try:
+                    raw = json.dumps([entry[0], entry[1], entry[2]])
+                except (TypeError, ValueError):
+                    self.stats['errors'] += 1
+                    continue
+                pipe.set(self.prefix + key, raw, px=ttl_ms)
+                self.stats['writes'] += 1
+            await pipe.execute()
+    
+    async def _delete_prefix(self):
+        """Delete this API's keys only (the server may be shared)"""
+        keys = []
+        async for key in self.client.scan_iter(match=f"{self.prefix}*", count=1000):
+            keys.append(key)
+            if len(keys) >= 1000:
+                await self.client.unlink(*keys)
+                keys = []
+        if keys:
+            await self.client.unlink(*keys)
+    
+    async def _close(self):
+        await self.client.aclose()
+    
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **super().snapshot(),
+            'pool_size': config.REDIS_POOL_SIZE,
+        }
+
+class MemoryBackend(CacheBackend):
+    """In-process stand-in for a shared backend (behaves like RedisCache)"""
+    
+    name = "memory"
+    shared = True
+    
+    def __init__(self):
+        super().__init__()
+        self.store: Dict[str, str] = {}
+    
+    async def _read(self, key: str) -> Optional[Tuple[float, float, Any]]:
+        raw = self.store.get(key)
+        if raw is None:
+            return None
+        stored_at, expires_at, value = json.loads(raw)
+        if time.time() >= expires_at:
+            del self.store[key]
+            return None
+        return stored_at, expires_at, value
+    
+    async def _write(self, batch: Dict[str, Optional[Tuple[float, float, Any]]], clear: bool):
+        if clear:
+            self.store.clear()
+        for key, entry in batch.items():
+            if entry is None:
+                self.store.pop(key, None)
+                continue
+            try:
+                self.store[key] = json.dumps([entry[0], entry[1], entry[2]])
+            except (TypeError, ValueError):
+                self.stats['errors'] += 1
+                continue
+            self.stats['writes'] += 1
+    
+    async def purge_expired(self):
+        now = time.time()
+        for key in [k for k, raw in self.store.items() if json.loads(raw)[1] <= now]:
+            del self.store[key]
+
+class Cache:
+    """O(1) in-memory LRU cache with expiry, a byte budget and an optional L2"""
+    
+    # Key prefixes reported separately; anything else is a legacy stream entry
+    NAMESPACES = ('stream', 'record', 'info', 'formats', 'search', 'playlist', 'channel', 'unavailable')
+    
+    # Histogram bucket upper bounds: age of entries when served, size when stored
+    AGE_BUCKETS = (1, 10, 60, 300, 900, 1800, 3600, 7200, 21600)
+    SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+    
+    def __init__(self, name: str = "cache", max_bytes: Optional[int] = None, ttl: Optional[int] = None):
+        self.name = name
+        self.max_bytes = max_bytes or config.MAX_CACHE_BYTES
+        self.default_ttl = ttl or config.CACHE_TTL
+        # key -> (stored_at, expires_at, value, size, near_until), in recency
+        # order; only touched on the event loop, so no lock is needed
+        self.cache: "OrderedDict[str, Tuple[float, float, Any, int, float]]" = OrderedDict()
+        self.used_bytes = 0
+        self.namespace_stats: Dict[str, Dict[str, Any]] = {}
+        self.rejected_oversize = 0
+        self.l2: Optional[CacheBackend] = None
+        self.l2_hits = 0
+        self.legacy_hits = 0
         self.hits = 0
         self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.sweeper: Optional[asyncio.Task] = None
+        
+        # Refresh-ahead: refresher(key) returns a coroutine that re-extracts
+        # the entry, or None if the key can't be refreshed
+        self.refresher: Optional[Callable[[str], Optional[Awaitable[Any]]]] = None
+        self.entry_hits: Dict[str, int] = {}
+        self.refreshing: Dict[str, asyncio.Task] = {}
+        self.refresh_stats = {
+            'started': 0,
+            'completed': 0,
+            'failed': 0,
+            'skipped_budget': 0,
+        }
+    
+    def __len__(self) -> int:
+        return len(self.cache)
+    
+    def _expiry_for(self, value: Any, now: float) -> float:
+        """
+        Absolute expiry for a value. Video records and stream results carry
+        googlevideo URLs with their own expire= timestamp; everything else
+        lives for the cache's default TTL.
+        """
+        if isinstance(value, dict):
+            expires_at = value.get('expires_at') or stream_url_expiry(value.get('stream_url', ''))
+            if expires_at:
+                return expires_at - config.STREAM_EXPIRY_MARGIN
+        return now + self.default_ttl
+    
+    @classmethod
+    def namespace(cls, key: str) -> str:
+        prefix = key.split(':', 1)[0]
+        return prefix if prefix in cls.NAMESPACES else 'stream'
+    
+    def _ns(self, key: str) -> Dict[str, Any]:
+        """Counters for key's namespace"""
+        namespace = self.namespace(key)
+        stats = self.namespace_stats.get(namespace)
+        if stats is None:
+            stats = self.namespace_stats[namespace] = {
+                'hits': 0,
+                'misses': 0,
+                'expirations': 0,
+                'evictions': 0,
+                'entries': 0,
+                'bytes': 0,
+                'hit_age': [0] * (len(self.AGE_BUCKETS) + 1),
+                'hit_age_sum': 0.0,
+                'size': [0] * (len(self.SIZE_BUCKETS) + 1),
+                'size_sum': 0,
+            }
+        return stats
+    
+    def _record_hit(self, key: str, stored_at: float):
+        stats = self._ns(key)
+        age = time.time() - stored_at
+        stats['hits'] += 1
+        stats['hit_age'][bisect_left(self.AGE_BUCKETS, age)] += 1
+        stats['hit_age_sum'] += age
+    
+    def _account(self, key: str, size: int, count: int):
+        stats = self._ns(key)
+        self.used_bytes += size
+        stats['bytes'] += size
+        stats['entries'] += count
+    
+    def _drop(self, key: str):
+        entry = self.cache.pop(key)
+        self.entry_hits.pop(key, None)
+        self._account(key, -entry[3], -1)
+    
+    @staticmethod
+    def stream_key(video_id: str, mode: str, quality: str = "best") -> str:
+        """
+        Canonical key for a resolved stream. Audio has a single quality, so
+        every audio request for a video shares one entry.
+        """
+        if mode == "audio":
+            quality = "best"
+        return f"stream:{video_id}:{mode}:{quality}"
+    
+    @staticmethod
+    def legacy_keys(key: str) -> List[str]:
+        """Keys the same entry was stored under before stream keys were canonical"""
+        if not config.CACHE_LEGACY_KEYS or not key.startswith('stream:'):
+            return []
+        match = re.match(r'^stream:([\w-]{11}):(video|audio):(\w+)$', key)
+        if not match:
+            return []
+        video_id, mode, quality = match.groups()
+        if mode == "audio":
+            return [f"audio:{video_id}"] + [f"{video_id}:audio:{q}" for q in ("best", "high", "medium", "low")]
+        return [f"{video_id}:{mode}:{quality}"]
     
     async def get(self, key: str) -> Optional[Any]:
-        """Get value from cache"""
-        async with self.lock:
-            if key in self.cache:
-                timestamp, value = self.cache[key]
-                if time.time() - timestamp < config.CACHE_TTL:
-                    self.hits += 1
-                    return value
-                else:
-                    del self.cache[key]
-                    self.misses += 1
-            else:
+        """Get value from cache (L1, then L2, then the key's legacy names)"""
+        value = await self._get(key)
+        if value is None:
+            aliases = self.legacy_keys(key)
+            if aliases:
+                value = await self._get_legacy(key, aliases)
+        return value
+    
+    def _l1_only_legacy(self) -> bool:
+        # A shared L2 would cost a network round trip per alias on every miss
+        return self.l2 is not None and self.l2.shared
+    
+    async def _get_legacy(self, key: str, aliases: List[str]) -> Optional[Any]:
+        """Serve an entry still stored under a legacy key and move it to key"""
+        for alias in aliases:
+            if alias not in self.cache and self._l1_only_legacy():
+                continue
+            value = await self._get(alias, record=False)
+            if value is not None:
+                # The canonical lookup already counted a miss
+                self.misses -= 1
+                self._ns(key)['misses'] -= 1
+                self.hits += 1
+                self._ns(key)['hits'] += 1
+                self.legacy_hits += 1
+                await self.delete(alias)
+                await self.set(key, value)
+                return value
+        return None
+    
+    async def _get(self, key: str, record: bool = True) -> Optional[Any]:
+        entry = self.cache.get(key)
+        if entry is None:
+            return await self._get_l2(key, record)
+        
+        timestamp, expires_at, value, size, near_until = entry
+        if time.time() >= near_until and time.time() < expires_at:
+            # Near-cache copy of a shared entry: re-read it in case another
+            # worker replaced or deleted it, keeping its refresh-ahead hits
+            hits = self.entry_hits.get(key, 0)
+            self._drop(key)
+            value = await self._get_l2(key, record)
+            if value is not None and key in self.cache:
+                self.entry_hits[key] = hits
+            return value
+        
+        if time.time() >= expires_at:
+            self._drop(key)
+            self.expirations += 1
+            self._ns(key)['expirations'] += 1
+            if record:
                 self.misses += 1
+                self._ns(key)['misses'] += 1
             return None
+        
+        self.cache.move_to_end(key)
+        if record:
+            self.hits += 1
+            self._record_hit(key, timestamp)
+        self.entry_hits[key] = self.entry_hits.get(key, 0) + 1
+        self._maybe_refresh(key, expires_at)
+        return value
     
-    async def set(self, key: str, value: Any):
-        """Set value in cache"""
-        async with self.lock:
-            # Remove oldest if cache is full
-            if len(self.cache) >= config.MAX_CACHE_SIZE:
-                oldest_key = min(self.cache.keys(), key=lambda k: self.cache[k][0])
-                del self.cache[oldest_key]
-            
-            self.cache[key] = (time.time(), value)
+    async def _get_l2(self, key: str, record: bool = True) -> Optional[Any]:
+        """L1 miss: serve from L2 and promote the entry back into L1"""
+        entry = await self.l2.get(key) if self.l2 is not None else None
+        if entry is None:
+            if record:
+                self.misses += 1
+                self._ns(key)['misses'] += 1
+            return None
+        
+        stored_at, expires_at, value = entry
+        if time.time() >= expires_at:
+            self.l2.delete(key)
+            self.expirations += 1
+            self._ns(key)['expirations'] += 1
+            if record:
+                self.misses += 1
+                self._ns(key)['misses'] += 1
+            return None
+        
+        # Don't clobber a fresher value stored while the disk read was running
+        if key not in self.cache:
+            self._store(key, value, stored_at, expires_at)
+        self.l2_hits += 1
+        if record:
+            self.hits += 1
+            self._record_hit(key, stored_at)
+        return value
+    
+    async def ttl(self, key: str) -> float:
+        """Remaining lifetime of a cached entry in seconds (0 if missing)"""
+        entry = self.cache.get(key)
+        if entry is None:
+            return 0.0
+        return max(0.0, entry[1] - time.time())
+    
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """Set value in cache (ttl defaults to the value's own expiry)"""
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else self._expiry_for(value, now)
+        if expires_at <= now:
+            # Already inside the safety margin; serving it would hand out a dead URL
+            return
+        
+        self._store(key, value, now, expires_at)
+        if self.l2 is not None:
+            self.l2.put(key, now, expires_at, value)
+    
+    def _store(self, key: str, value: Any, stored_at: float, expires_at: float):
+        """Put an entry in L1, evicting least recently used entries to fit"""
+        size = approx_size(key) + approx_size(value)
+        if size > self.max_bytes:
+            self.rejected_oversize += 1
+            return
+        
+        if key in self.cache:
+            self._drop(key)
+        
+        # Evict least recently used entries until the new one fits
+        while self.cache and self.used_bytes + size > self.max_bytes:
+            oldest_key = next(iter(self.cache))
+            self._drop(oldest_key)
+            self.evictions += 1
+            self._ns(oldest_key)['evictions'] += 1
+        
+        # Copies of shared entries are only trusted for CACHE_NEAR_TTL
+        near_until = time.time() + config.CACHE_NEAR_TTL if self.l2 is not None and self.l2.shared else expires_at
+        self.cache[key] = (stored_at, expires_at, value, size, near_until)
+        self._account(key, size, 1)
+        stats = self._ns(key)
+        stats['size'][bisect_left(self.SIZE_BUCKETS, size)] += 1
+        stats['size_sum'] += size
     
     async def delete(self, key: str):
-        """Delete key from cache"""
-        async with self.lock:
-            if key in self.cache:
-                del self.cache[key]
+        """Delete key from cache (and any legacy names for it)"""
+        for name in [key] + self.legacy_keys(key):
+            if name in self.cache:
+                self._drop(name)
+            elif name != key and self._l1_only_legacy():
+                continue  # Legacy names in a shared L2 just expire
+            if self.l2 is not None:
+                self.l2.delete(name)
+    
+    async def clear(self):
+        """Drop every entry"""
+        self.cache.clear()
+        self.entry_hits.clear()
+        self.used_bytes = 0
+        for stats in self.namespace_stats.values():
+            stats['entries'] = 0
+            stats['bytes'] = 0
+        if self.l2 is not None:
+            self.l2.clear()
+    
+    async def open_l2(self) -> int:
+        """Open the CACHE_BACKEND tier and warm L1 from it; returns entries loaded"""
+        if config.CACHE_BACKEND == "none" or self.l2 is not None:
+            return 0
+        
+        if config.CACHE_BACKEND == "redis":
+            try:
+                prefix = config.REDIS_PREFIX if self.name == "cache" else f"{config.REDIS_PREFIX}{self.name}:"
+                self.l2 = RedisCache(config.REDIS_URL, prefix)
+                rows = await self.l2.start()
+            except ImportError:
+                logger.warning("⚠️ CACHE_BACKEND is redis but redis is not installed (pip install redis); falling back to sqlite")
+                self.l2 = None
+            except Exception as e:
+                logger.warning(f"⚠️ Redis cache backend unavailable ({e}), falling back to sqlite")
+                self.l2 = None
+        elif config.CACHE_BACKEND == "memory":
+            self.l2 = MemoryBackend()
+            rows = await self.l2.start()
+        
+        if self.l2 is None:
+            self.l2 = DiskCache(os.path.join(config.CACHE_DIR, f"{self.name}.db"))
+            rows = await self.l2.start()
+        # Oldest first, so the most recently stored entries end up most recently used
+        for key, stored_at, expires_at, value in rows:
+            self._store(key, value, stored_at, expires_at)
+        return len(rows)
+    
+    async def close_l2(self):
+        """Flush pending L2 writes and close it"""
+        if self.l2 is not None:
+            await self.l2.close()
+            self.l2 = None
+    
+    def memory_stats(self) -> Dict[str, Any]:
+        """Resident bytes overall and per key namespace"""
+        return {
+            'bytes': self.used_bytes,
+            'max_bytes': self.max_bytes,
+            'utilization': round(self.used_bytes / self.max_bytes, 3),
+            'rejected_oversize': self.rejected_oversize,
+            'namespaces': {
+                namespace: {
+                    'entries': stats['entries'],
+                    'bytes': stats['bytes'],
+                }
+                for namespace, stats in self.namespace_stats.items()
+                if stats['entries']
+            },
+        }
+    
+    @staticmethod
+    def _histogram(bounds: Tuple[int, ...], counts: List[int], unit: str) -> Dict[str, int]:
+        labels = [f"<={bound}{unit}" for bound in bounds] + [f">{bounds[-1]}{unit}"]
+        return dict(zip(labels, counts))
+    
+    def namespace_snapshot(self) -> Dict[str, Any]:
+        """Per-namespace hit ratio, churn, residency and histograms"""
+        snapshot = {}
+        for namespace, stats in self.namespace_stats.items():
+            lookups = stats['hits'] + stats['misses']
+            snapshot[namespace] = {
+                'hits': stats['hits'],
+                'misses': stats['misses'],
+                'hit_ratio': round(stats['hits'] / lookups, 3) if lookups else None,
+                'expirations': stats['expirations'],
+                'evictions': stats['evictions'],
+                'entries': stats['entries'],
+                'bytes': stats['bytes'],
+                'hit_age_seconds': self._histogram(self.AGE_BUCKETS, stats['hit_age'], 's'),
+                'entry_size_bytes': self._histogram(self.SIZE_BUCKETS, stats['size'], 'B'),
+            }
+        return snapshot
+    
+    def metric_samples(self) -> Dict[str, List[Tuple[Dict[str, str], float]]]:
+        """
+        Prometheus samples by metric name, labelled with cache and namespace
+        (histograms as cumulative _bucket/_sum/_count series)
+        """
+        samples: Dict[str, List[Tuple[Dict[str, str], float]]] = {}
+        
+        def add(metric: str, labels: Dict[str, str], value: float):
+            samples.setdefault(metric, []).append((labels, value))
+        
+        for namespace, stats in self.namespace_stats.items():
+            labels = {'cache': self.name, 'namespace': namespace}
+            for field in ('hits', 'misses', 'expirations', 'evictions'):
+                add(f"ytapi_cache_{field}_total", labels, stats[field])
+            add("ytapi_cache_entries", labels, stats['entries'])
+            add("ytapi_cache_bytes", labels, stats['bytes'])
+            
+            for metric, bounds, counts, total in (
+                ("ytapi_cache_hit_age_seconds", self.AGE_BUCKETS, stats['hit_age'], stats['hit_age_sum']),
+                ("ytapi_cache_entry_size_bytes", self.SIZE_BUCKETS, stats['size'], stats['size_sum']),
+            ):
+                cumulative = 0
+                for bound, count in zip(list(bounds) + ['+Inf'], counts):
+                    cumulative += count
+                    add(f"{metric}_bucket", {**labels, 'le': str(bound)}, cumulative)
+                add(f"{metric}_sum", labels, total)
+                add(f"{metric}_count", labels, cumulative)
+        
+        add("ytapi_cache_max_bytes", {'cache': self.name}, self.max_bytes)
+        return samples
+    
+    async def sweep(self) -> int:
+        """
+        Drop expired entries. Walks the cache in CACHE_SWEEP_BATCH chunks,
+        yielding to the event loop between chunks so large caches don't
+        stall requests.
+        """
+        removed = 0
+        keys = list(self.cache)
+        for offset in range(0, len(keys), config.CACHE_SWEEP_BATCH):
+            now = time.time()
+            for key in keys[offset:offset + config.CACHE_SWEEP_BATCH]:
+                entry = self.cache.get(key)
+                if entry is not None and now >= entry[1]:
+                    self._drop(key)
+                    self._ns(key)['expirations'] += 1
+                    removed += 1
+            await asyncio.sleep(0)
+        self.expirations += removed
+        if self.l2 is not None:
+            await self.l2.purge_expired()
+        return removed
+    
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(config.CACHE_SWEEP_INTERVAL)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.warning(f"⚠️ Cache sweep error: {e}")
+    
+    def start_sweeper(self):
+        """Start the periodic expiry sweep"""
+        if self.sweeper is None:
+            self.sweeper = asyncio.ensure_future(self._sweep_loop())
+    
+    def stop_sweeper(self):
+        if self.sweeper is not None:
+            self.sweeper.cancel()
+            self.sweeper = None
+    
+    def _refresh_budget(self) -> int:
+        """Max concurrent refreshes, as a share of extraction capacity"""
+        return max(1, int(config.EXTRACTION_WORKERS * config.REFRESH_AHEAD_MAX_SHARE))
+    
+    def _maybe_refresh(self, key: str, expires_at: float):
+        """Start a background refresh for a hot entry that is close to expiry"""
+        if (not config.REFRESH_AHEAD_ENABLED
+                or self.refresher is None
+                or key in self.refreshing
+                or expires_at - time.time() > config.REFRESH_AHEAD_WINDOW
+                or self.entry_hits.get(key, 0) < config.REFRESH_AHEAD_MIN_HITS):
+            return
+        
+        if len(self.refreshing) >= self._refresh_budget():
+            self.refresh_stats['skipped_budget'] += 1
+            return
+        
+        refresh = self.refresher(key)
+        if refresh is None:
+            return
+        
+        self.refresh_stats['started'] += 1
+        self.refreshing[key] = asyncio.ensure_future(self._run_refresh(key, refresh))
+    
+    async def _run_refresh(self, key: str, refresh: Awaitable[Any]):
+        try:
+            await refresh
+            self.refresh_stats['completed'] += 1
+        except Exception as e:
+            self.refresh_stats['failed'] += 1
+            logger.warning(f"⚠️ Cache refresh error for {key}: {e}")
+        finally:
+            self.refreshing.pop(key, None)
+
+class ExtractionTimeout(TimeoutError):
+    """An extraction ran past its YTDLP_TIMEOUT deadline"""
+
+class WorkerProcess:
+    """One extraction worker process, fed jobs over its own pipe"""
+
+    def __init__(self, context, initializer: Callable):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=worker_loop, args=(child_conn, initializer), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.tasks = 0
+        self.broken = False  # Killed, or its pipe closed mid-job
+
+    async def call(self, func: Callable, args: tuple) -> Any:
+        """Run one job; raises BrokenProcessPool if the worker dies meanwhile"""
+        loop = asyncio.get_running_loop()
+        readable = loop.create_future()
+        fd = self.conn.fileno()
+        self.tasks += 1
+        try:
+            self.conn.send((func, args))
+        except OSError as e:
+            self.broken = True
+            raise BrokenProcessPool(f"Extraction worker {self.process.pid} died") from e
+        loop.add_reader(fd, lambda: readable.done() or readable.set_result(None))
+        try:
+            await readable
+        finally:
+            loop.remove_reader(fd)
+        try:
+            ok, value = self.conn.recv()
+        except (EOFError, OSError) as e:
+            self.broken = True
+            raise BrokenProcessPool(f"Extraction worker {self.process.pid} died") from e
+        if not ok:
+            raise value
+        return value
+
+    def stop(self):
+        """Close the pipe; an idle worker exits on its own"""
+        self.conn.close()
+
+    def kill(self):
+        self.broken = True
+        self.process.kill()
+
+class ExtractionExecutor:
+    """Bounded thread pool (plus optional worker processes) for blocking yt-dlp extraction"""
+
+    def __init__(self):
+        self.pool = ThreadPoolExecutor(
+            max_workers=config.EXTRACTION_WORKERS,
+            thread_name_prefix="extraction"
+        )
+        self.process_workers: List[WorkerProcess] = []
+        self.idle_workers: List[WorkerProcess] = []
+        self.process_slots: Optional[asyncio.Semaphore] = None
+        self.process_initializer: Optional[Callable] = None
+        self.process_restarts = 0
+        self.process_kills = 0
+        self.timeouts = 0
+        self.abandoned = 0  # Timed-out or cancelled jobs still running in a worker
+        self.semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.thread_slots = asyncio.Semaphore(config.EXTRACTION_WORKERS)
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.by_endpoint: Dict[str, Dict[str, Any]] = {}
+
+    def _semaphore(self, endpoint: str) -> asyncio.Semaphore:
+        """Get (or create) the concurrency cap for an endpoint"""
+        if endpoint not in self.semaphores:
+            limit = config.EXTRACTION_CONCURRENCY.get(endpoint, config.EXTRACTION_WORKERS)
+            self.semaphores[endpoint] = asyncio.Semaphore(limit)
+        return self.semaphores[endpoint]
+
+    def _endpoint_stats(self, endpoint: str) -> Dict[str, Any]:
+        if endpoint not in self.by_endpoint:
+            self.by_endpoint[endpoint] = {
+                'queued': 0,
+                'active': 0,
+                'completed': 0,
+                'failed': 0,
+                'timeouts': 0,
+                'total_wait': 0.0,
+            }
+        return self.by_endpoint[endpoint]
+
+    def _timed_out(self, endpoint: str) -> ExtractionTimeout:
+        self.timeouts += 1
+        self._endpoint_stats(endpoint)['timeouts'] += 1
+        return ExtractionTimeout(f"Extraction timed out after {config.YTDLP_TIMEOUT}s")
+
+    def _abandoned_done(self, finish: Callable[[], None]):
+        self.abandoned -= 1
+        finish()
+
+    def _abandoned_job_done(self, task: asyncio.Future, finish: Callable[[], None]):
+        if not task.cancelled():
+            task.exception()  # Nobody awaits it any more; retrieve so asyncio doesn't log it
+        self._abandoned_done(finish)
+
+    def _mark_started(self, endpoint: str, job: Dict[str, Any], started: float):
+        """Move a job from queued to active (called on the event loop)"""
+        if job['done']:
+            return
+        job['running'] = True
+        if 'started' in job:
+            job['started'].set_result(started)
+        wait = started - job['submitted']
+        stats = self._endpoint_stats(endpoint)
+        self.queued -= 1
+        self.active += 1
+        stats['queued'] -= 1
+        stats['active'] += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        stats['total_wait'] += wait
+
+    async def run(self, endpoint: str, func: Callable, *args) -> Any:
+        """Run a blocking function in the pool under the endpoint's cap"""
+        loop = asyncio.get_running_loop()
+        stats = self._endpoint_stats(endpoint)
+        semaphore = self._semaphore(endpoint)
+        job = {'submitted': time.time(), 'running': False, 'done': False, 'started': loop.create_future()}
+        held = []
+        future = None
+        self.queued += 1
+        stats['queued'] += 1
+
+        def call():
+            loop.call_soon_threadsafe(self._mark_started, endpoint, job, time.time())
+            return func(*args)
+
+        def finish():
+            # State only changes on the loop, so queued/active stay consistent
+            # even when the caller is cancelled mid-flight
+            job['done'] = True
+            if job['running']:
+                self.active -= 1
+                stats['active'] -= 1
+            else:
+                self.queued -= 1
+                stats['queued'] -= 1
+            for acquired in held:
+                acquired.release()
+
+        try:
+            # Endpoint caps add up to more than the pool has threads; the
+            # shared thread slot keeps jobs from queueing inside the pool
+            for needed in (semaphore, self.thread_slots):
+                await needed.acquire()
+                held.append(needed)
+            future = self.pool.submit(call)
+            wrapped = asyncio.wrap_future(future)
+            # The deadline runs from when a thread picks the job up
+            await asyncio.wait({wrapped, job['started']}, return_when=asyncio.FIRST_COMPLETED)
+            if not wrapped.done():
+                remaining = config.YTDLP_TIMEOUT - (time.time() - job['started'].result())
+                done, _ = await asyncio.wait({wrapped}, timeout=max(0.0, remaining))
+                if not done:
+                    raise self._timed_out(endpoint)
+            result = wrapped.result()
+            self.completed += 1
+            stats['completed'] += 1
+            return result
+        except Exception:
+            self.failed += 1
+            stats['failed'] += 1
+            raise
+        finally:
+            # Threads can't be killed: a job that already started and timed out
+            # or lost its caller (e.g. a hedged-out audio attempt) is abandoned
+            # and keeps its thread, slots and active count until yt-dlp returns;
+            # one still waiting for a thread is dropped outright
+            if future is not None and not future.done() and not future.cancel():
+                self.abandoned += 1
+                future.add_done_callback(
+                    lambda f: loop.call_soon_threadsafe(self._abandoned_done, finish)
+                )
+            else:
+                finish()
+
+    def start_processes(self, initializer: Callable):
+        """Start the process backend; each worker runs initializer once"""
+        self.process_initializer = initializer
+        self.process_slots = asyncio.Semaphore(config.PROCESS_WORKERS)
+        for _ in range(config.PROCESS_WORKERS):
+            self._spawn_worker()
+
+    def _spawn_worker(self):
+        worker = WorkerProcess(multiprocessing.get_context("spawn"), self.process_initializer)
+        self.process_workers.append(worker)
+        self.idle_workers.append(worker)
+
+    def _release_worker(self, worker: WorkerProcess):
+        """Return a worker to the idle list, replacing it if it died or is due for recycling"""
+        if worker.broken or not worker.process.is_alive():
+            self.process_restarts += 1
+            worker.kill()  # Make sure a worker whose pipe broke is really gone
+        elif worker.tasks < config.PROCESS_MAX_TASKS_PER_CHILD:
+            self.idle_workers.append(worker)
+            return
+        worker.stop()  # A worker due for recycling (bounds memory growth) exits on its own
+        self.process_workers.remove(worker)
+        if self.process_slots is not None:
+            self._spawn_worker()
+
+    async def run_process(self, endpoint: str, func: Callable, *args) -> Any:
+        """Run a picklable job in a worker process under the endpoint's cap"""
+        if self.process_slots is None:
+            raise RuntimeError("Process extraction backend is not running")
+
+        loop = asyncio.get_running_loop()
+        stats = self._endpoint_stats(endpoint)
+        semaphore = self._semaphore(endpoint)
+        job = {'submitted': time.time(), 'running': False, 'done': False}
+        held = []
+        worker = None
+        task = None
+        self.queued += 1
+        stats['queued'] += 1
+
+        def finish():
+            job['done'] = True
+            if job['running']:
+                self.active -= 1
+                stats['active'] -= 1
+            else:
+                self.queued -= 1
+                stats['queued'] -= 1
+            if worker is not None:
+                self._release_worker(worker)
+            for acquired in held:
+                acquired.release()
+
+        try:
+            for needed in (semaphore, self.process_slots):
+                await needed.acquire()
+                held.append(needed)
+            # A process slot guarantees an idle worker
+            worker = self.idle_workers.pop()
+            # Workers report nothing back until they finish, so a job
+            # counts as active from the moment it is handed to a worker
+            self._mark_started(endpoint, job, time.time())
+            task = asyncio.ensure_future(worker.call(func, args))
+            # Workers enforce YTDLP_TIMEOUT themselves; this is the
+            # backstop for a worker stuck where the alarm can't reach.
+            # asyncio.wait, not wait_for: a TimeoutError raised by the
+            # job itself must not be mistaken for the backstop firing
+            done, _ = await asyncio.wait({task}, timeout=config.PROCESS_JOB_TIMEOUT)
+            if not done:
+                # Only this worker is killed; the others keep their jobs
+                worker.kill()
+                self.process_kills += 1
+                raise self._timed_out(endpoint)
+            result = task.result()
+            self.completed += 1
+            stats['completed'] += 1
+            return result
+        except TimeoutError as e:
+            # Deadline raised inside the worker (see extraction.extraction_deadline)
+            self.failed += 1
+            stats['failed'] += 1
+            if isinstance(e, ExtractionTimeout):
+                raise
+            raise self._timed_out(endpoint) from e
+        except Exception:
+            # Includes BrokenProcessPool: a worker that died (OOM, segfault)
+            # is replaced when it is released
+            self.failed += 1
+            stats['failed'] += 1
+            raise
+        finally:
+            # A job a worker is still running when its caller goes away (e.g.
+            # a hedged-out audio attempt) or after its worker was killed keeps
+            # its slot until the worker returns or its pipe closes
+            if task is not None and not task.done():
+                self.abandoned += 1
+                task.add_done_callback(lambda t: self._abandoned_job_done(t, finish))
+            else:
+                finish()
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and wait-time counters"""
+        started = self.completed + self.failed + self.active
+        return {
+            'backend': config.EXTRACTION_BACKEND,
+            'workers': config.PROCESS_WORKERS if self.process_slots else config.EXTRACTION_WORKERS,
+            'deadline': config.YTDLP_TIMEOUT,
+            'timeouts': self.timeouts,
+            'abandoned': self.abandoned,
+            'process_restarts': self.process_restarts,
+            'process_kills': self.process_kills,
+            'queued': self.queued,
+            'active': self.active,
+            'completed': self.completed,
+            'failed': self.failed,
+            'avg_wait': round(self.total_wait / started, 4) if started else 0.0,
+            'max_wait': round(self.max_wait, 4),
+            'by_endpoint': {
+                endpoint: {
+                    'limit': config.EXTRACTION_CONCURRENCY.get(endpoint, config.EXTRACTION_WORKERS),
+                    'queued': s['queued'],
+                    'active': s['active'],
+                    'completed': s['completed'],
+                    'failed': s['failed'],
+                    'timeouts': s['timeouts'],
+                    'total_wait': round(s['total_wait'], 4),
+                }
+                for endpoint, s in self.by_endpoint.items()
+            }
+        }
+
+    def shutdown(self):
+        """Stop accepting work and release the worker threads"""
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.process_slots = None
+        for worker in self.process_workers:
+            worker.kill()
+        self.process_workers = []
+        self.idle_workers = []
+
+class MethodRanker:
+    """Rolling success rate and latency per extraction method"""
+
+    def __init__(self):
+        self.history: Dict[str, deque] = {}
+        self.explored = 0
+
+    def record(self, method: str, success: bool, latency: float):
+        """Record the outcome of one completed attempt"""
+        if method not in self.history:
+            self.history[method] = deque(maxlen=config.AUDIO_METHOD_WINDOW)
+        self.history[method].append((success, latency))
+
+    def success_rate(self, method: str) -> float:
+        """Smoothed success rate; methods without history start at 0.5"""
+        outcomes = self.history.get(method, ())
+        successes = sum(1 for success, _ in outcomes if success)
+        return (successes + 1) / (len(outcomes) + 2)
+
+    def avg_latency(self, method: str) -> float:
+        outcomes = self.history.get(method, ())
+        if not outcomes:
+            return 0.0
+        return sum(latency for _, latency in outcomes) / len(outcomes)
+
+    def rank(self, methods: List[str]) -> List[str]:
+        """
+        Order methods by likelihood of success (then latency). A small share
+        of calls moves a random lower-ranked method to the front so the
+        stats for the others stay current.
+        """
+        ranked = sorted(
+            methods,
+            key=lambda m: (-self.success_rate(m), self.avg_latency(m))
+        )
+        if len(ranked) > 1 and random.random() < config.AUDIO_METHOD_EXPLORE_RATE:
+            self.explored += 1
+            ranked.insert(0, ranked.pop(random.randrange(1, len(ranked))))
+        return ranked
+
+    def snapshot(self, methods: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Current ranking with per-method stats"""
+        names = methods if methods is not None else list(self.history.keys())
+        ranked = sorted(
+            names,
+            key=lambda m: (-self.success_rate(m), self.avg_latency(m))
+        )
+        return [
+            {
+                'method': method,
+                'rank': position + 1,
+                'success_rate': round(self.success_rate(method), 3),
+                'avg_latency': round(self.avg_latency(method), 3),
+                'samples': len(self.history.get(method, ())),
+            }
+            for position, method in enumerate(ranked)
+        ]
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker for one extraction path"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.times_opened = 0
+        self.skipped = 0
+        self.last_change = time.time()
+
+    def _transition(self, state: str):
+        if state != self.state:
+            logger.warning(f"⚡ Circuit {self.name}: {self.state} -> {state}")
+            self.state = state
+            self.last_change = time.time()
+
+    def allow(self) -> bool:
+        """Whether an attempt may run now (claims the probe when half-open)"""
+        if self.state == self.OPEN:
+            if time.time() - self.opened_at < config.BREAKER_COOLDOWN:
+                self.skipped += 1
+                return False
+            self._transition(self.HALF_OPEN)
+            self.probe_in_flight = False
+
+        if self.state == self.HALF_OPEN:
+            if self.probe_in_flight:
+                self.skipped += 1
+                return False
+            self.probe_in_flight = True
+
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.probe_in_flight = False
+        self._transition(self.CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        self.probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= config.BREAKER_FAILURE_THRESHOLD:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+            self.opened_at = time.time()
+            self._transition(self.OPEN)
+
+    def release(self):
+        """Give back a half-open probe whose attempt was cancelled"""
+        self.probe_in_flight = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'state': self.state,
+            'consecutive_failures': self.failures,
+            'times_opened': self.times_opened,
+            'skipped': self.skipped,
+            'since': self.last_change,
+        }
+
+class CircuitBreakers:
+    """Named circuit breakers (audio methods, player clients)"""
+
+    def __init__(self):
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, name: str) -> CircuitBreaker:
+        if name not in self.breakers:
+            self.breakers[name] = CircuitBreaker(name)
+        return self.breakers[name]
+
+    def states(self) -> Dict[str, str]:
+        return {name: breaker.state for name, breaker in self.breakers.items()}
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {name: breaker.snapshot() for name, breaker in self.breakers.items()}
+
+class IdentityPool:
+    """Rotates extractions across (cookie file, proxy) identities, ejecting throttled ones"""
+
+    def __init__(self):
+        self.identities = configured_identities()
+        self.outcomes: Dict[str, deque] = {}
+        self.last_used: Dict[str, float] = {}
+        self.ejected_until: Dict[str, float] = {}
+        self.throttle_streak: Dict[str, int] = {}
+        self.stats: Dict[str, Dict[str, Any]] = {}
+        for identity in self.identities:
+            name = identity['name']
+            self.outcomes[name] = deque(maxlen=config.IDENTITY_ERROR_WINDOW)
+            self.last_used[name] = 0.0
+            self.ejected_until[name] = 0.0
+            self.throttle_streak[name] = 0
+            self.stats[name] = {
+                'requests': 0,
+                'successes': 0,
+                'failures': 0,
+                'throttled': 0,
+                'ejections': 0,
+                'busy_time': 0.0,
+            }
+
+    def error_rate(self, name: str) -> float:
+        outcomes = self.outcomes[name]
+        if not outcomes:
+            return 0.0
+        return sum(1 for success in outcomes if not success) / len(outcomes)
+
+    def has_cookies(self) -> bool:
+        """Whether any identity has a usable cookie file"""
+        return any(
+            identity['cookies'] and cookie_store_for(identity['cookies']).available()
+            for identity in self.identities
+        )
+
+    def acquire(self) -> Dict[str, Any]:
+        """Identity for the next extraction"""
+        now = time.time()
+        active = [i for i in self.identities if self.ejected_until[i['name']] <= now]
+        if not active:
+            # Everyone is ejected: use whichever comes back first
+            active = [min(self.identities, key=lambda i: self.ejected_until[i['name']])]
+
+        # Error rates are bucketed so near-equal identities rotate by LRU
+        identity = min(
+            active,
+            key=lambda i: (round(self.error_rate(i['name']), 1), self.last_used[i['name']])
+        )
+        self.last_used[identity['name']] = now
+        self.stats[identity['name']]['requests'] += 1
+        return identity
+
+    def record(self, identity: Dict[str, Any], success: bool, latency: float,
+               error: Optional[BaseException] = None):
+        """Record one finished extraction made as identity"""
+        name = identity['name']
+        stats = self.stats[name]
+        stats['busy_time'] += latency
+        self.outcomes[name].append(success)
+
+        if success:
+            stats['successes'] += 1
+            self.throttle_streak[name] = 0
+            return
+
+        stats['failures'] += 1
+        if not (isinstance(error, IdentityThrottled) or is_throttle_message(str(error or ''))):
+            return
+
+        stats['throttled'] += 1
+        self.throttle_streak[name] += 1
+        if self.throttle_streak[name] >= config.IDENTITY_EJECT_THRESHOLD:
+            self.throttle_streak[name] = 0
+            self.ejected_until[name] = time.time() + config.IDENTITY_EJECT_COOLDOWN
+            stats['ejections'] += 1
+            logger.warning(f"🪪 Identity {name} ejected for {config.IDENTITY_EJECT_COOLDOWN}s (throttled)")
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.time()
+        snapshot = {}
+        for identity in self.identities:
+            name = identity['name']
+            stats = self.stats[name]
+            snapshot[name] = {
+                **stats,
+                'busy_time': round(stats['busy_time'], 3),
+                'avg_latency': round(stats['busy_time'] / max(stats['successes'] + stats['failures'], 1), 3),
+                'error_rate': round(self.error_rate(name), 3),
+                'ejected_for': round(max(self.ejected_until[name] - now, 0), 1),
+                'last_used': self.last_used[name] or None,
+                'proxy': identity['proxy'],
+                'cookies': cookie_store_for(identity['cookies']).snapshot() if identity['cookies'] else None,
+            }
+        return snapshot
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one in-flight call"""
+
+    def __init__(self):
+        self.inflight: Dict[str, asyncio.Future] = {}
+        self.calls = 0
+        self.coalesced = 0
+        self.by_kind: Dict[str, Dict[str, int]] = {}
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Await the in-flight call for key, or start one with func()"""
+        kind = key.split(':', 1)[0]
+        counters = self.by_kind.setdefault(kind, {'calls': 0, 'coalesced': 0})
+        self.calls += 1
+        counters['calls'] += 1
+
+        task = self.inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            counters['coalesced'] += 1
+        else:
+            task = asyncio.ensure_future(func())
+            self.inflight[key] = task
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+
+        # Shield so one caller disconnecting doesn't cancel the others' result
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'in_flight': len(self.inflight),
+            'calls': self.calls,
+            'coalesced': self.coalesced,
+            'by_kind': self.by_kind,
+        }
+
+class PrefetchQueue:
+    """Low-priority background queue for warming the cache"""
+
+    def __init__(self):
+        self.queue: Optional[asyncio.Queue] = None
+        self.workers: List[asyncio.Task] = []
+        self.pending: set = set()
+        self.stats = {
+            'queued': 0,
+            'completed': 0,
+            'failed': 0,
+            'rejected': 0,
+        }
+
+    def start(self, handler: Callable[[Any], Awaitable[bool]]):
+        """Start PREFETCH_WORKERS workers; handler(item) returns True on success"""
+        self.queue = asyncio.Queue(maxsize=config.PREFETCH_QUEUE_SIZE)
+        self.workers = [
+            asyncio.ensure_future(self._worker(handler))
+            for _ in range(config.PREFETCH_WORKERS)
+        ]
+
+    def submit(self, key: str, item: Any) -> bool:
+        """Queue an item unless it is already pending or the queue is full"""
+        if key in self.pending:
+            return True
+        if self.queue is None or self.queue.full():
+            self.stats['rejected'] += 1
+            return False
+        self.pending.add(key)
+        self.queue.put_nowait((key, item))
+        self.stats['queued'] += 1
+        return True
+
+    async def _worker(self, handler: Callable[[Any], Awaitable[bool]]):
+        while True:
+            key, item = await self.queue.get()
+            try:
+                # Yield to live traffic: wait while user requests queue for extraction
+                while extraction_executor.queued > 0:
+                    await asyncio.sleep(0.5)
+                if await handler(item):
+                    self.stats['completed'] += 1
+                else:
+                    self.stats['failed'] += 1
+            except Exception as e:
+                self.stats['failed'] += 1
+                logger.warning(f"⚠️ Prefetch error for {key}: {e}")
+            finally:
+                self.pending.discard(key)
+                self.queue.task_done()
+
+    def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        self.workers = []
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            'pending': len(self.pending),
+            'workers': len(self.workers),
+        }
+
+class ThumbnailNotFound(Exception):
+    """i.ytimg.com has no thumbnail for the video"""
+
+class ThumbnailCache:
+    """Size-capped disk cache of thumbnails from i.ytimg.com and their resized variants"""
+    
+    SOURCES = ('maxresdefault', 'hqdefault')  # Tried in order; maxres is missing for older videos
+    
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.files: OrderedDict = OrderedDict()  # File name -> (size, last served), least recent first
+        self.bytes = 0
+        self.originals = SingleFlight()  # Every width of a video shares one download of the original
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="thumbnails")
+        self.resize_available = True
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'fetches': 0,
+            'fetch_errors': 0,
+            'resizes': 0,
+            'evictions': 0,
+        }
+    
+    async def _call(self, func: Callable, *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+    
+    def _scan(self) -> List[Tuple[str, int]]:
+        os.makedirs(self.directory, exist_ok=True)
+        found = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.tmp'):
+                os.remove(entry.path)  # Left over from an interrupted write
+            elif entry.is_file() and entry.name.endswith('.jpg'):
+                stat = entry.stat()
+                found.append((stat.st_mtime, entry.name, stat.st_size))
+        return [(name, size) for _, name, size in sorted(found)]
+    
+    async def start(self):
+        """Index files already on disk and open the shared HTTP session"""
+        for name, size in await self._call(self._scan):
+            self.files[name] = (size, 0.0)
+            self.bytes += size
+        self.session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=config.THUMBNAIL_FETCH_TIMEOUT),
+            connector=aiohttp.TCPConnector(limit=config.THUMBNAIL_FETCH_CONCURRENCY),
+        )
+    
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        self.executor.shutdown(wait=False)
+    
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+    
+    async def get(self, video_id: str, width: Optional[int] = None) -> str:
+        """
+        Path of the cached thumbnail (resized to width if given), fetching and
+        resizing on a miss. Raises ThumbnailNotFound if YouTube has none.
+        """
+        if not self.resize_available:
+            width = None
+        name = f"{video_id}_{width}.jpg" if width else f"{video_id}.jpg"
+        if name in self.files:
+            self.stats['hits'] += 1
+            self._touch(name)
+            return self.path(name)
+        
+        self.stats['misses'] += 1
+        original = f"{video_id}.jpg"
+        if original in self.files:
+            # Touched before any await, so eviction's grace period covers the resize
+            self._touch(original)
+        else:
+            await self.originals.do(original, lambda: self._ensure_original(video_id, original))
+        
+        if not width:
+            return self.path(original)
+        
+        try:
+            data = await self._call(self._resize, self.path(original), width)
+        except ImportError:
+            logger.warning("⚠️ Thumbnail resizing disabled: Pillow not installed (pip install Pillow); serving originals")
+            self.resize_available = False
+            return self.path(original)
+        self.stats['resizes'] += 1
+        await self._store(name, data)
+        return self.path(name)
+    
+    def _touch(self, name: str):
+        self.files[name] = (self.files[name][0], time.time())
+        self.files.move_to_end(name)
+    
+    async def _ensure_original(self, video_id: str, original: str):
+        if original not in self.files:
+            await self._store(original, await self._fetch(video_id))
+    
+    async def _fetch(self, video_id: str) -> bytes:
+        self.stats['fetches'] += 1
+        for source in self.SOURCES:
+            url = f"https://i.ytimg.com/vi/{video_id}/{source}.jpg"
+            try:
+                async with self.session.get(url, proxy=config.PROXY) as response:
+                    if response.status == 404:
+                        continue
+                    response.raise_for_status()
+                    return await response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                self.stats['fetch_errors'] += 1
+                raise
+        raise ThumbnailNotFound(video_id)
+    
+    @staticmethod
+    def _resize(path: str, width: int) -> bytes:
+        from io import BytesIO
+        from PIL import Image
+        
+        with Image.open(path) as image:
+            if image.width > width:
+                height = max(1, round(image.height * width / image.width))
+                image = image.resize((width, height), Image.LANCZOS)
+            buffer = BytesIO()
+            image.convert('RGB').save(buffer, 'JPEG', quality=85, optimize=True)
+        return buffer.getvalue()
+    
+    def _write(self, name: str, data: bytes):
+        # Write to a unique temp file then rename, so a file being served is
+        # never seen half-written or replaced under a reader
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, self.path(name))
+    
+    @staticmethod
+    def _remove(paths: List[str]):
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    
+    async def _store(self, name: str, data: bytes):
+        await self._call(self._write, name, data)
+        now = time.time()
+        self.bytes += len(data) - self.files.pop(name, (0, 0.0))[0]
+        self.files[name] = (len(data), now)
+        
+        # Evict least recently served files. Anything served in the last
+        # THUMBNAIL_EVICT_GRACE seconds may still be streaming, so the budget
+        # is allowed to overshoot rather than unlink it
+        evicted = []
+        while self.bytes > self.max_bytes and self.files:
+            old_name, (size, served_at) = next(iter(self.files.items()))
+            if now - served_at < config.THUMBNAIL_EVICT_GRACE:
+                break
+            del self.files[old_name]
+            self.bytes -= size
+            evicted.append(self.path(old_name))
+        if evicted:
+            self.stats['evictions'] += len(evicted)
+            await self._call(self._remove, evicted)
+    
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            'files': len(self.files),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'resize_available': self.resize_available,
+        }
+
+# Metric types for render_metrics; histogram series share their base name's type
+METRIC_TYPES = {
+    'ytapi_cache_hits_total': ('counter', 'Cache lookups served'),
+    'ytapi_cache_misses_total': ('counter', 'Cache lookups not served'),
+    'ytapi_cache_expirations_total': ('counter', 'Entries dropped because they expired'),
+    'ytapi_cache_evictions_total': ('counter', 'Entries evicted to stay within the byte budget'),
+    'ytapi_cache_entries': ('gauge', 'Resident entries'),
+    'ytapi_cache_bytes': ('gauge', 'Approximate resident bytes'),
+    'ytapi_cache_max_bytes': ('gauge', 'Byte budget'),
+    'ytapi_cache_hit_age_seconds': ('histogram', 'Age of entries when served'),
+    'ytapi_cache_entry_size_bytes': ('histogram', 'Approximate size of entries when stored'),
+}
+
+def render_metrics(*caches: "Cache") -> str:
+    """Prometheus text exposition format for the given caches"""
+    samples: Dict[str, List[Tuple[Dict[str, str], float]]] = {}
+    for cache_instance in caches:
+        for metric, series in cache_instance.metric_samples().items():
+            samples.setdefault(metric, []).extend(series)
+    
+    lines = []
+    for base, (metric_type, help_text) in METRIC_TYPES.items():
+        names = [base] if metric_type != 'histogram' else [f"{base}_bucket", f"{base}_sum", f"{base}_count"]
+        if not any(name in samples for name in names):
+            continue
+        lines.append(f"# HELP {base} {help_text}")
+        lines.append(f"# TYPE {base} {metric_type}")
+        for name in names:
+            for labels, value in samples.get(name, ()):
+                label_text = ','.join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}")
+    return '\n'.join(lines) + '\n'
 
 # Global instances
 rate_limiter = RateLimiter()
 cache = Cache()
+# Searches get their own budget and TTL so they never evict stream URLs
+search_cache = Cache("search", config.SEARCH_CACHE_MAX_BYTES, config.SEARCH_CACHE_TTL)
+extraction_executor = ExtractionExecutor()
+method_ranker = MethodRanker()
+single_flight = SingleFlight()
+circuit_breakers = CircuitBreakers()
+identity_pool = IdentityPool()
+prefetch_queue = PrefetchQueue()
+thumbnail_cache = ThumbnailCache(config.THUMBNAIL_DIR, config.THUMBNAIL_CACHE_MAX_BYTES)
 youtube_utils = YouTubeUtils()
 
 # Convenience function for backward compatibility